@@ -0,0 +1,60 @@
+"""Add books.total_copies and books.available_count
+
+Revision ID: 3f1c2a9b7d10
+Revises:
+Create Date: 2026-10-18 09:00:00.000000
+
+Databases created before copy tracking have neither column (create_all does
+not alter existing tables), and any that picked them up from the server
+default count every title as one copy on the shelf, including titles out on
+loan. Both cases end up with counts derived from the open loans (and Ready
+holds, which also keep a copy off the shelf).
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3f1c2a9b7d10"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("ALTER TABLE books ADD COLUMN IF NOT EXISTS total_copies INTEGER NOT NULL DEFAULT 1")
+    op.execute("ALTER TABLE books ADD COLUMN IF NOT EXISTS available_count INTEGER NOT NULL DEFAULT 1")
+    op.execute("ALTER TABLE books DROP CONSTRAINT IF EXISTS ck_books_available_count")
+
+    # Every open loan holds a copy, and so does every Ready hold where the
+    # hold queue already exists; a title never has fewer copies than that.
+    held = "SELECT book_id FROM borrow_records WHERE returned_at IS NULL"
+    if not context.is_offline_mode() and sa.inspect(op.get_bind()).has_table("holds"):
+        held += " UNION ALL SELECT book_id FROM holds WHERE status = 'Ready'"
+    op.execute(
+        f"""
+        UPDATE books
+        SET total_copies = GREATEST(total_copies, taken.n),
+            available_count = GREATEST(total_copies, taken.n) - taken.n
+        FROM (
+            SELECT books.id, count(held.book_id) AS n
+            FROM books LEFT JOIN ({held}) AS held ON held.book_id = books.id
+            GROUP BY books.id
+        ) AS taken
+        WHERE books.id = taken.id
+        """
+    )
+
+    op.create_check_constraint(
+        "ck_books_available_count", "books", "available_count >= 0 AND available_count <= total_copies"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint("ck_books_available_count", "books", type_="check")
+    op.drop_column("books", "available_count")
+    op.drop_column("books", "total_copies")
@@ -0,0 +1,69 @@
+"""Add the unique index on open loans
+
+Revision ID: 5d7a9c1e3b20
+Revises: 8b2e4d6f1a3c
+Create Date: 2026-10-18 14:00:00.000000
+
+Borrows insert with ON CONFLICT DO NOTHING on (user_id, book_id) WHERE
+returned_at IS NULL, which Postgres rejects unless uq_borrow_records_open
+exists, and create_all never adds indexes to a table that already exists.
+The index is built CONCURRENTLY so loans keep moving while it builds.
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5d7a9c1e3b20"
+down_revision: Union[str, Sequence[str], None] = "8b2e4d6f1a3c"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _build_index(name: str, create: str) -> None:
+    # A concurrent build that fails leaves an invalid index behind, which
+    # IF NOT EXISTS would then keep; drop it so the build is retried.
+    op.execute(
+        f"""
+        DO $$
+        BEGIN
+            IF EXISTS (
+                SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE c.relname = '{name}' AND NOT i.indisvalid
+            ) THEN
+                DROP INDEX {name};
+            END IF;
+        END $$
+        """
+    )
+    op.execute(create)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if not context.is_offline_mode():
+        duplicates = op.get_bind().scalar(sa.text(
+            "SELECT count(*) FROM ("
+            "SELECT 1 FROM borrow_records WHERE returned_at IS NULL"
+            " GROUP BY user_id, book_id HAVING count(*) > 1) dup"
+        ))
+        if duplicates:
+            raise RuntimeError(
+                f"{duplicates} member/title pairs have more than one open loan; "
+                "return the extra loans before upgrading"
+            )
+
+    with op.get_context().autocommit_block():
+        _build_index(
+            "uq_borrow_records_open",
+            "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_borrow_records_open"
+            " ON borrow_records (user_id, book_id) WHERE returned_at IS NULL",
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS uq_borrow_records_open")
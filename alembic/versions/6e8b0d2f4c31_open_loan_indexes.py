@@ -0,0 +1,60 @@
+"""Add the partial indexes on open loans
+
+Revision ID: 6e8b0d2f4c31
+Revises: 5d7a9c1e3b20
+Create Date: 2026-10-18 14:30:00.000000
+
+The active list, the overdue list and the scheduler scan only read open
+loans; create_all never adds these indexes to an existing borrow_records
+table. Built CONCURRENTLY so loans keep moving while they build.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "6e8b0d2f4c31"
+down_revision: Union[str, Sequence[str], None] = "5d7a9c1e3b20"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = {
+    "ix_borrow_records_open_borrowed_at":
+        "borrow_records (borrowed_at, id) WHERE returned_at IS NULL",
+    "ix_borrow_records_open_due_at":
+        "borrow_records (due_at) WHERE returned_at IS NULL",
+}
+
+
+def _build_index(name: str, create: str) -> None:
+    # A concurrent build that fails leaves an invalid index behind, which
+    # IF NOT EXISTS would then keep; drop it so the build is retried.
+    op.execute(
+        f"""
+        DO $$
+        BEGIN
+            IF EXISTS (
+                SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE c.relname = '{name}' AND NOT i.indisvalid
+            ) THEN
+                DROP INDEX {name};
+            END IF;
+        END $$
+        """
+    )
+    op.execute(create)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, on in INDEXES.items():
+            _build_index(name, f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {on}")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
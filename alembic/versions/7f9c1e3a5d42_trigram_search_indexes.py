@@ -0,0 +1,63 @@
+"""Add the trigram search indexes
+
+Revision ID: 7f9c1e3a5d42
+Revises: 6e8b0d2f4c31
+Create Date: 2026-10-18 15:00:00.000000
+
+Book and user search match substrings with a leading wildcard, which only
+these GIN trigram indexes can serve; create_all never adds them to existing
+tables. Built CONCURRENTLY so writes keep going while they build.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "7f9c1e3a5d42"
+down_revision: Union[str, Sequence[str], None] = "6e8b0d2f4c31"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = {
+    "ix_books_title_trgm":
+        "books USING gin (title gin_trgm_ops)",
+    "ix_users_name_trgm":
+        "users USING gin (name gin_trgm_ops)",
+    "ix_users_email_trgm":
+        "users USING gin (email gin_trgm_ops)",
+}
+
+
+def _build_index(name: str, create: str) -> None:
+    # A concurrent build that fails leaves an invalid index behind, which
+    # IF NOT EXISTS would then keep; drop it so the build is retried.
+    op.execute(
+        f"""
+        DO $$
+        BEGIN
+            IF EXISTS (
+                SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE c.relname = '{name}' AND NOT i.indisvalid
+            ) THEN
+                DROP INDEX {name};
+            END IF;
+        END $$
+        """
+    )
+    op.execute(create)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    with op.get_context().autocommit_block():
+        for name, on in INDEXES.items():
+            _build_index(name, f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {on}")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
@@ -0,0 +1,30 @@
+"""Add users.token_version
+
+Revision ID: 8b2e4d6f1a3c
+Revises: 3f1c2a9b7d10
+Create Date: 2026-10-18 12:00:00.000000
+
+Databases created before session revocation have no token_version column
+(create_all does not alter existing tables). Every existing user starts at
+version 0, which is what tokens issued without a version carry.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8b2e4d6f1a3c"
+down_revision: Union[str, Sequence[str], None] = "3f1c2a9b7d10"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS token_version INTEGER NOT NULL DEFAULT 0")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("users", "token_version")
@@ -0,0 +1,69 @@
+"""Add the inbox indexes on notifications
+
+Revision ID: 9a1d3f5b7e63
+Revises: 7f9c1e3a5d42
+Create Date: 2026-10-18 15:30:00.000000
+
+Inbox pages, the unread filter, read-all, inbox trimming and the unread
+count reconciliation all read notifications through (user_id, created_at,
+id); create_all never adds these indexes to an existing table. Built
+CONCURRENTLY so notifications keep arriving while they build.
+
+Databases created before these indexes also carry ix_notifications_user_id,
+the single-column index from ``user_id`` being declared with index=True.
+The model no longer declares it: the composite index leads with user_id and
+serves every lookup it did, including the ON DELETE CASCADE from users. It
+is dropped once the composite one exists, and restored on downgrade.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "9a1d3f5b7e63"
+down_revision: Union[str, Sequence[str], None] = "7f9c1e3a5d42"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = {
+    "ix_notifications_user_created_at_id":
+        "notifications (user_id, created_at, id)",
+    "ix_notifications_unread_user_created_at_id":
+        "notifications (user_id, created_at, id) WHERE NOT is_read",
+}
+
+
+def _build_index(name: str, create: str) -> None:
+    # A concurrent build that fails leaves an invalid index behind, which
+    # IF NOT EXISTS would then keep; drop it so the build is retried.
+    op.execute(
+        f"""
+        DO $$
+        BEGIN
+            IF EXISTS (
+                SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE c.relname = '{name}' AND NOT i.indisvalid
+            ) THEN
+                DROP INDEX {name};
+            END IF;
+        END $$
+        """
+    )
+    op.execute(create)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, on in INDEXES.items():
+            _build_index(name, f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {on}")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_notifications_user_id")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_notifications_user_id ON notifications (user_id)")
+        for name in INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
@@ -0,0 +1,61 @@
+"""Add the keyset indexes on books
+
+Revision ID: ab2e4a6c8f74
+Revises: 9a1d3f5b7e63
+Create Date: 2026-10-18 16:00:00.000000
+
+GET /books pages by (created_at, id) or (title, id); without these indexes
+every page sorts the whole table, and create_all never adds them to an
+existing books table. Built CONCURRENTLY so the catalog stays writable
+while they build.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "ab2e4a6c8f74"
+down_revision: Union[str, Sequence[str], None] = "9a1d3f5b7e63"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = {
+    "ix_books_created_at_id":
+        "books (created_at, id)",
+    "ix_books_title_id":
+        "books (title, id)",
+}
+
+
+def _build_index(name: str, create: str) -> None:
+    # A concurrent build that fails leaves an invalid index behind, which
+    # IF NOT EXISTS would then keep; drop it so the build is retried.
+    op.execute(
+        f"""
+        DO $$
+        BEGIN
+            IF EXISTS (
+                SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE c.relname = '{name}' AND NOT i.indisvalid
+            ) THEN
+                DROP INDEX {name};
+            END IF;
+        END $$
+        """
+    )
+    op.execute(create)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, on in INDEXES.items():
+            _build_index(name, f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {on}")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
@@ -12,6 +12,10 @@ class Settings(BaseSettings):
     algorithm: str
     access_token_expire_minutes: int
     
+    password_hash_workers: int = 2
+    password_hash_queue: int = 64
+    password_hash_timeout: float = 5.0
+    
     smtp_host: str
     smtp_port: str
     smtp_user: str
@@ -19,6 +23,19 @@ class Settings(BaseSettings):
     smtp_from: str
     
     redis_url: str
+    local_cache_size: int = 2048
+    principal_cache_ttl: int = 300
+    
+    suggest_max_entries: int = 2_000_000
+    
+    borrow_archive_after_days: int = 90
+    borrow_archive_batch_size: int = 5000
+    hold_claim_hours: int = 48
+    
+    notification_retention_days: int = 90
+    notification_inbox_cap: int = 1000
+    notification_retention_batch_size: int = 1000
+    notification_retention_pause: float = 0.1
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,555 @@
+import asyncio
+import enum
+import hashlib
+import inspect
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, datetime
+from functools import wraps
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple
+
+from fastapi import Request, Response
+from fastapi.dependencies.utils import get_typed_signature
+from fastapi_cache import FastAPICache
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import get_session
+from app.models import User
+
+# Two-tier, tag-invalidated response cache on top of the fastapi-cache Redis
+# backend.
+#
+# Every cached response is stored under its own key and that key is added to
+# one Redis set per tag it depends on ("book:12", "books:offset", ...). A write
+# invalidates exactly the tags it affects, which deletes the member keys and
+# leaves every other cached page alone.
+#
+# Each worker also keeps a small LRU of recent entries in front of Redis.
+# Invalidations are published on a Redis channel so every worker evicts the
+# same tags from its local tier.
+
+# KEYS[1] = entry, KEYS[2] = tag sequence hash, KEYS[3..n] = tag sets;
+# ARGV[1] = payload, ARGV[2] = ttl, ARGV[3] = fill token or "".
+#
+# A fill whose data was read before an invalidation of one of its tags must
+# not be stored after it, or the stale entry would outlive the write. Every
+# invalidation stamps its tags with a new sequence number; a fill carries the
+# sequence current when it started reading (its token) and is dropped,
+# returning 0, if any of its tags has been stamped since.
+#
+# A tag set may hold entries from several namespaces, so its TTL is only ever
+# extended and always outlives its longest-lived member. Entries expire
+# without leaving their sets, so each store also samples a few members and
+# drops those that are gone; a tag that is rarely invalidated but keyed by
+# user input (search terms, cursors) then stays proportional to its live
+# entries instead of growing for as long as it keeps being written.
+_STORE_LUA = """
+if ARGV[3] ~= '' then
+    for i = 3, #KEYS do
+        local stamped = redis.call('HGET', KEYS[2], KEYS[i])
+        if stamped and tonumber(stamped) > tonumber(ARGV[3]) then
+            return 0
+        end
+    end
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+for i = 3, #KEYS do
+    redis.call('SADD', KEYS[i], KEYS[1])
+    for _, member in ipairs(redis.call('SRANDMEMBER', KEYS[i], 3)) do
+        if redis.call('EXISTS', member) == 0 then
+            redis.call('SREM', KEYS[i], member)
+        end
+    end
+    if redis.call('TTL', KEYS[i]) < tonumber(ARGV[2]) then
+        redis.call('EXPIRE', KEYS[i], ARGV[2])
+    end
+end
+return 1
+"""
+
+# KEYS[1] = sequence, KEYS[2] = tag sequence hash, KEYS[3..n] = tag sets.
+# Deletes every member entry and the sets themselves, and stamps the tags
+# with the next sequence number.
+_INVALIDATE_LUA = """
+local n = 0
+local seq = redis.call('INCR', KEYS[1])
+for i = 3, #KEYS do
+    local members = redis.call('SMEMBERS', KEYS[i])
+    for j = 1, #members, 500 do
+        n = n + redis.call('DEL', unpack(members, j, math.min(j + 499, #members)))
+    end
+    redis.call('DEL', KEYS[i])
+    redis.call('HSET', KEYS[2], KEYS[i], seq)
+end
+return n
+"""
+
+# Endpoint arguments of these types make up the cache key; sessions, the
+# request and the authenticated user are left out.
+_KEY_TYPES = (str, int, float, bool, enum.Enum, date, datetime, list, tuple, type(None))
+
+TagFunc = Callable[[Dict[str, Any], Any], Iterable[str]]
+
+
+_CHANNEL = "invalidate"
+_VERSIONS = "versions"
+_SEQUENCE = "invalidation_seq"
+_TAG_SEQUENCES = "tag_seq"
+
+
+@dataclass
+class _Entry:
+    body: bytes
+    tags: Tuple[str, ...]
+    fresh_until: float
+    stale_until: float
+
+
+def _pack(entry: _Entry) -> bytes:
+    # "<fresh_until> <tag> <tag> ...\n<json body>"; the header lets any worker
+    # rebuild the local entry, tags included, from a Redis hit.
+    header = " ".join((f"{entry.fresh_until:.3f}", *entry.tags))
+    return header.encode() + b"\n" + entry.body
+
+
+def _unpack(raw: bytes, stale_for: int) -> _Entry:
+    header, body = raw.split(b"\n", 1)
+    fresh_until, *tags = header.decode().split(" ")
+    fresh_until = float(fresh_until)
+    return _Entry(body, tuple(tags), fresh_until, fresh_until + stale_for)
+
+
+class LocalCache:
+    """Per-process LRU of cache entries, indexed by tag for eviction."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._by_tag: Dict[str, Set[str]] = {}
+
+    def get(self, key: str, now: float) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if now >= entry.stale_until:
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, entry: _Entry) -> None:
+        self._drop(key)
+        self._entries[key] = entry
+        for tag in entry.tags:
+            self._by_tag.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    def evict_tags(self, tags: Iterable[str]) -> None:
+        for tag in tags:
+            for key in list(self._by_tag.get(tag, ())):
+                self._drop(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._by_tag.clear()
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry.tags:
+            keys = self._by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_tag[tag]
+
+
+local_cache = LocalCache(max_entries=settings.local_cache_size)
+
+# key -> future of the computation currently filling it (single-flight).
+_inflight: Dict[str, "asyncio.Future[_Entry]"] = {}
+_background: Set["asyncio.Task"] = set()
+
+
+def _redis():
+    return FastAPICache.get_backend().redis
+
+
+def _tag_key(tag: str) -> str:
+    return f"{FastAPICache.get_prefix()}:tag:{tag}"
+
+
+def _channel() -> str:
+    return f"{FastAPICache.get_prefix()}:{_CHANNEL}"
+
+
+def _versions_key() -> str:
+    return f"{FastAPICache.get_prefix()}:{_VERSIONS}"
+
+
+def _key(name: str) -> str:
+    return f"{FastAPICache.get_prefix()}:{name}"
+
+
+def _family(tag: str) -> str:
+    # "book:12" -> "book", "books:offset" -> "books"
+    return tag.split(":", 1)[0]
+
+
+def _entry_key(namespace: str, func: Callable, params: Dict[str, Any]) -> str:
+    raw = json.dumps(params, sort_keys=True, default=str)
+    digest = hashlib.md5(raw.encode()).hexdigest()
+    return f"{FastAPICache.get_prefix()}:{namespace}:{func.__name__}:{digest}"
+
+
+def _json_response(body: bytes) -> Response:
+    return Response(content=body, media_type="application/json")
+
+
+async def _read(key: str, stale_for: int) -> Optional[_Entry]:
+    try:
+        raw = await _redis().get(key)
+    except Exception as e:
+        print(f"[cache] Read of '{key}' failed: {e}")
+        return None
+    if raw is None:
+        return None
+    entry = _unpack(raw, stale_for)
+    local_cache.put(key, entry)
+    return entry
+
+
+def _store(client, key: str, entry: _Entry, ttl: int, token: Optional[int] = None):
+    """Queue (on a pipeline) or run the SET + tag registration for ``entry``.
+
+    With a ``token`` from :func:`fill_token` the store is skipped (result 0)
+    if any of the entry's tags was invalidated after the token was taken.
+    """
+    return client.eval(
+        _STORE_LUA, len(entry.tags) + 2, key, _key(_TAG_SEQUENCES), *map(_tag_key, entry.tags),
+        _pack(entry), ttl, "" if token is None else token,
+    )
+
+
+async def fill_token() -> Optional[int]:
+    """Take before reading the data for a fill and pass to the store, so the
+    fill is dropped if the data was invalidated in between. ``None`` (Redis
+    unreachable) disables the check."""
+    try:
+        return int(await _redis().get(_key(_SEQUENCE)) or 0)
+    except Exception as e:
+        print(f"[cache] Sequence read failed: {e}")
+        return None
+
+
+async def _single_flight(key: str, compute: Callable[[], Awaitable[_Entry]]) -> _Entry:
+    """Run ``compute`` once per key in this process; concurrent callers share it."""
+    while key in _inflight:
+        pending = _inflight[key]
+        try:
+            return await asyncio.shield(pending)
+        except asyncio.CancelledError:
+            # Take over if the leader was cancelled (client went away), but
+            # still honour our own cancellation.
+            if not pending.cancelled():
+                raise
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        entry = await compute()
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        # Mark the exception retrieved when nobody else was waiting.
+        future.exception()
+        raise
+    else:
+        future.set_result(entry)
+        return entry
+    finally:
+        _inflight.pop(key, None)
+
+
+def cached(
+    namespace: str,
+    expire: int,
+    model: Any,
+    tags: Optional[TagFunc] = None,
+    stale_while_revalidate: int = 0,
+    unless: Optional[Callable[[Dict[str, Any]], bool]] = None,
+    per_user: bool = False,
+):
+    """Cache a GET endpoint's JSON body under dependency tags.
+
+    ``model`` is the endpoint's response model; the result is validated and
+    serialized with it once, and hits are returned as raw JSON without
+    touching Pydantic again. ``tags(params, data)`` receives the key
+    parameters and the JSON-ready result and returns the tags the entry
+    depends on.
+
+    Lookups try the local LRU, then Redis. On a miss only one coroutine per
+    key and process runs the endpoint; the rest await its result. With
+    ``stale_while_revalidate`` an expired entry is still served for that many
+    seconds while a background task refreshes it. Calls for which
+    ``unless(params)`` is true bypass this cache entirely.
+
+    Users are never part of the key, so by default everyone allowed to call
+    the endpoint shares its entries. With ``per_user`` the current user's id
+    is added to the key parameters as ``user_id``.
+    """
+    adapter = TypeAdapter(model)
+
+    def decorator(func):
+        async def compute(key: str, params: Dict[str, Any], args, kwargs) -> _Entry:
+            token = await fill_token()
+            result = await func(*args, **kwargs)
+            data = adapter.dump_python(adapter.validate_python(result, from_attributes=True), mode="json")
+            body = json.dumps(data, separators=(",", ":")).encode()
+            entry_tags = tuple(sorted(set(tags(params, data) if tags else ())))
+
+            fresh_until = time.time() + expire
+            entry = _Entry(body, entry_tags, fresh_until, fresh_until + stale_while_revalidate)
+            try:
+                stored = await _store(_redis(), key, entry, expire + stale_while_revalidate, token)
+            except Exception as e:
+                print(f"[cache] Write of '{key}' failed: {e}")
+                stored = True
+            if stored:
+                local_cache.put(key, entry)
+            return entry
+
+        async def revalidate(key: str, params: Dict[str, Any], args, kwargs) -> None:
+            # The request that served the stale entry has closed its session
+            # by the time this runs, so the refresh gets its own.
+            async with get_session() as db:
+                kwargs = {k: (db if isinstance(v, AsyncSession) else v) for k, v in kwargs.items()}
+                try:
+                    await _single_flight(key, lambda: compute(key, params, args, kwargs))
+                except Exception as e:
+                    print(f"[cache] Background refresh of '{key}' failed: {e}")
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            params = {k: v for k, v in kwargs.items() if isinstance(v, _KEY_TYPES)}
+            if per_user:
+                params["user_id"] = next(v.id for v in kwargs.values() if isinstance(v, User))
+            if unless is not None and unless(params):
+                return await func(*args, **kwargs)
+            key = _entry_key(namespace, func, params)
+
+            now = time.time()
+            entry = local_cache.get(key, now) or await _read(key, stale_while_revalidate)
+            if entry is not None:
+                if now < entry.fresh_until:
+                    return _json_response(entry.body)
+                if now < entry.stale_until:
+                    if key not in _inflight:
+                        task = asyncio.create_task(revalidate(key, params, args, kwargs))
+                        _background.add(task)
+                        task.add_done_callback(_background.discard)
+                    return _json_response(entry.body)
+
+            entry = await _single_flight(key, lambda: compute(key, params, args, kwargs))
+            return _json_response(entry.body)
+
+        return wrapper
+
+    return decorator
+
+
+def _item_key(namespace: str, id: int) -> str:
+    return f"{FastAPICache.get_prefix()}:{namespace}:item:{id}"
+
+
+async def get_items(namespace: str, ids: Iterable[int]) -> Dict[int, bytes]:
+    """Cached JSON bodies of individual records, from the local tier or one
+    Redis MGET. Missing ids are simply absent from the result."""
+    now = time.time()
+    found: Dict[int, bytes] = {}
+    remote = []
+    for id in ids:
+        entry = local_cache.get(_item_key(namespace, id), now)
+        if entry is not None and now < entry.fresh_until:
+            found[id] = entry.body
+        else:
+            remote.append(id)
+    if not remote:
+        return found
+
+    try:
+        raws = await _redis().mget([_item_key(namespace, id) for id in remote])
+    except Exception as e:
+        print(f"[cache] Item read from '{namespace}' failed: {e}")
+        return found
+    for id, raw in zip(remote, raws):
+        if raw is not None:
+            entry = _unpack(raw, 0)
+            local_cache.put(_item_key(namespace, id), entry)
+            found[id] = entry.body
+    return found
+
+
+async def set_items(
+    namespace: str, items: Dict[int, Tuple[bytes, Iterable[str]]], expire: int, token: Optional[int] = None
+) -> None:
+    """Store individual records as ``{id: (json body, tags)}`` in one round trip.
+
+    Pass the :func:`fill_token` taken before the records were read; records
+    invalidated since are not stored.
+    """
+    if not items:
+        return
+    fresh_until = time.time() + expire
+    entries = {
+        _item_key(namespace, id): _Entry(body, tuple(item_tags), fresh_until, fresh_until)
+        for id, (body, item_tags) in items.items()
+    }
+    try:
+        async with _redis().pipeline(transaction=False) as pipe:
+            for key, entry in entries.items():
+                _store(pipe, key, entry, expire, token)
+            stored = await pipe.execute()
+    except Exception as e:
+        print(f"[cache] Item write to '{namespace}' failed: {e}")
+        stored = [True] * len(entries)
+    for (key, entry), ok in zip(entries.items(), stored):
+        if ok:
+            local_cache.put(key, entry)
+
+
+async def invalidate(*tags: str) -> None:
+    """Drop every cached response that depends on any of ``tags``, in Redis
+    and in the local tier of every worker."""
+    if not tags:
+        return
+    local_cache.evict_tags(tags)
+    try:
+        async with _redis().pipeline(transaction=False) as pipe:
+            pipe.eval(_INVALIDATE_LUA, len(tags) + 2, _key(_SEQUENCE), _key(_TAG_SEQUENCES), *map(_tag_key, tags))
+            for family in {_family(tag) for tag in tags}:
+                pipe.hincrby(_versions_key(), family, 1)
+            pipe.publish(_channel(), " ".join(tags))
+            await pipe.execute()
+    except Exception as e:
+        print(f"[cache] Invalidation of {tags} failed: {e}")
+
+
+async def bump_versions(*scopes: str) -> None:
+    """Advance version counters for data that has no cached entries to drop,
+    so ETags derived from those scopes change."""
+    if not scopes:
+        return
+    try:
+        async with _redis().pipeline(transaction=False) as pipe:
+            for scope in scopes:
+                pipe.hincrby(_versions_key(), scope, 1)
+            await pipe.execute()
+    except Exception as e:
+        print(f"[cache] Version bump of {scopes} failed: {e}")
+
+
+ScopeFunc = Callable[[Dict[str, Any], Optional[User]], Iterable[str]]
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(candidate.strip().removeprefix("W/") == etag for candidate in header.split(","))
+
+
+def conditional(scopes: ScopeFunc):
+    """Strong ETags and ``If-None-Match`` handling for a GET endpoint.
+
+    The ETag is a hash of the endpoint, its key parameters, the caller and the
+    current version counters of ``scopes(params, user)``. Every write that
+    calls ``invalidate`` advances the counter of each tag family it touches
+    ("book:12" advances "book"), and ``bump_versions`` covers data that is not
+    cached at all. A matching ``If-None-Match`` is answered with 304 after a
+    single Redis HMGET, before the endpoint runs.
+    """
+    def decorator(func):
+        # Resolved against the endpoint's own module so string annotations work.
+        signature = get_typed_signature(inspect.unwrap(func))
+
+        # FastAPI hands the Request/Response to a single parameter each, so
+        # reuse the endpoint's own if it declares one.
+        injected = []
+        param_names = {}
+        for annotation, name in ((Request, "__etag_request"), (Response, "__etag_response")):
+            existing = next((p.name for p in signature.parameters.values() if p.annotation is annotation), None)
+            if existing is None:
+                injected.append(inspect.Parameter(name, inspect.Parameter.KEYWORD_ONLY, annotation=annotation))
+            param_names[annotation] = existing or name
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            request: Request = kwargs[param_names[Request]]
+            response: Response = kwargs[param_names[Response]]
+            for param in injected:
+                kwargs.pop(param.name)
+
+            params = {k: v for k, v in kwargs.items() if isinstance(v, _KEY_TYPES)}
+            user = next((v for v in kwargs.values() if isinstance(v, User)), None)
+            scope_names = list(scopes(params, user))
+            try:
+                versions = await _redis().hmget(_versions_key(), scope_names) if scope_names else []
+            except Exception as e:
+                print(f"[cache] Version read of {scope_names} failed: {e}")
+                return await func(*args, **kwargs)
+
+            fingerprint = json.dumps(
+                [func.__module__, func.__name__, params, user.id if user else None,
+                 [v.decode() if isinstance(v, bytes) else v for v in versions]],
+                sort_keys=True, default=str,
+            )
+            etag = f'"{hashlib.md5(fingerprint.encode()).hexdigest()}"'
+
+            if _etag_matches(request.headers.get("if-none-match"), etag):
+                return Response(status_code=304, headers={"ETag": etag})
+
+            result = await func(*args, **kwargs)
+            (result if isinstance(result, Response) else response).headers["ETag"] = etag
+            return result
+
+        wrapper.__signature__ = signature.replace(
+            parameters=[*signature.parameters.values(), *injected]
+        )
+        return wrapper
+
+    return decorator
+
+
+async def listen_for_invalidations() -> None:
+    """Apply invalidations published by other workers to the local tier.
+
+    Messages missed while disconnected cannot be replayed, so the local tier
+    is emptied whenever the subscription is (re)established.
+    """
+    while True:
+        try:
+            pubsub = _redis().pubsub()
+            await pubsub.subscribe(_channel())
+            local_cache.clear()
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    data = message["data"]
+                    if isinstance(data, bytes):
+                        data = data.decode()
+                    local_cache.evict_tags(data.split(" "))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[cache] Invalidation listener error: {e}")
+            local_cache.clear()
+            await asyncio.sleep(1)
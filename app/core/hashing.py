@@ -0,0 +1,92 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, status
+
+from app.config import settings
+from app.utils import hash_password, verify_and_update_password
+
+# bcrypt is deliberately slow, so it never runs on the event loop. Calls go to
+# a small process pool (threads would still contend on the GIL for the parts
+# passlib runs in Python), and only one call per worker is handed to it at a
+# time; the rest wait here, where giving up costs nothing. At most
+# ``password_hash_queue`` calls may be running or waiting at once, and a call
+# that cannot finish, waiting included, within ``password_hash_timeout``
+# seconds gets a 503 instead of piling up behind a login storm or a stuck
+# worker. A pool whose worker died is replaced on the next call.
+
+_pool: Optional[ProcessPoolExecutor] = None
+_slots: Optional[asyncio.Semaphore] = None
+_pending = 0
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool, _slots
+    if _pool is None:
+        # Forking a process that runs an event loop and driver threads is
+        # unsafe, so workers are spawned fresh and only import app.utils.
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.password_hash_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        _slots = asyncio.Semaphore(settings.password_hash_workers)
+    return _pool
+
+
+def _busy(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=detail,
+                         headers={"Retry-After": "1"})
+
+
+async def _run(func, *args):
+    global _pending
+    if _pending >= settings.password_hash_queue:
+        raise _busy("Too many sign-ins in progress, try again shortly")
+    _pending += 1
+    try:
+        pool, slots = _executor(), _slots
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.password_hash_timeout
+        try:
+            await asyncio.wait_for(slots.acquire(), timeout=settings.password_hash_timeout)
+        except asyncio.TimeoutError:
+            raise _busy("Password check timed out, try again shortly")
+        try:
+            future = loop.run_in_executor(pool, func, *args)
+            return await asyncio.wait_for(future, timeout=max(0.0, deadline - loop.time()))
+        except asyncio.TimeoutError:
+            raise _busy("Password check timed out, try again shortly")
+        except BrokenProcessPool:
+            print("[hashing] Worker process died, replacing the pool")
+            _discard(pool)
+            raise _busy("Password check failed, try again shortly")
+        finally:
+            slots.release()
+    finally:
+        _pending -= 1
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run(hash_password, password)
+
+
+async def verify_password_async(password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+    """Verify off the event loop; see ``verify_and_update_password``."""
+    return await _run(verify_and_update_password, password, password_hash)
+
+
+def _discard(pool: ProcessPoolExecutor) -> None:
+    global _pool, _slots
+    if _pool is pool:
+        _pool, _slots = None, None
+    pool.shutdown(wait=False)
+
+
+def shutdown_hash_pool() -> None:
+    global _pool, _slots
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool, _slots = None, None
@@ -1,6 +1,217 @@
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
+import re
+import time
+from dataclasses import dataclass
+from functools import wraps
+from typing import Dict, Optional, Tuple
 
-limiter = Limiter(key_func=get_remote_address)
+from fastapi import HTTPException, Request, status
+from fastapi_cache import FastAPICache
+from jose import JWTError, jwt
 
-rate_limit_handler = _rate_limit_exceeded_handler
\ No newline at end of file
+from app.config import settings
+
+# Sliding-window rate limits shared by every worker through Redis.
+#
+# Each (route, client) pair counts requests in fixed windows; a check weighs
+# the previous window by how much of it still overlaps the sliding window
+# ending now, adds the current one, and only counts the request if that stays
+# under the limit. The read-check-increment is one Lua script, so it is one
+# round trip and atomic across workers, and rejected requests are not counted.
+#
+# Clients are keyed by the user id of a valid bearer token, else by address
+# (run uvicorn with --proxy-headers/--forwarded-allow-ips behind a proxy so
+# that is the real client). If Redis is unreachable each worker enforces the
+# same limits from memory until it comes back.
+#
+# Responses of limited routes carry RateLimit-Limit, RateLimit-Remaining,
+# RateLimit-Reset (seconds) and RateLimit-Policy headers; a 429 also carries
+# Retry-After.
+
+# KEYS[1] = current window, KEYS[2] = previous window;
+# ARGV[1] = limit, ARGV[2] = weight of the previous window, ARGV[3] = ttl.
+# Returns {allowed, requests in the sliding window}.
+_HIT_LUA = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+local used = math.floor(previous * tonumber(ARGV[2])) + current
+if used >= tonumber(ARGV[1]) then
+    return {0, used}
+end
+if redis.call('INCR', KEYS[1]) == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+return {1, used + 1}
+"""
+
+_UNITS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+_LIMIT_RE = re.compile(r"^\s*(\d+)\s*(?:/|per)\s*(\d+)?\s*(second|minute|hour|day)s?\s*$")
+
+# Seconds to keep answering from memory after Redis fails before trying it again.
+_RETRY_REDIS_AFTER = 5
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    amount: int
+    window: int
+
+    @classmethod
+    def parse(cls, value: str) -> "RateLimit":
+        match = _LIMIT_RE.match(value)
+        if match is None:
+            raise ValueError(f"Invalid rate limit '{value}'")
+        amount, multiple, unit = match.groups()
+        return cls(int(amount), int(multiple or 1) * _UNITS[unit])
+
+
+@dataclass
+class RateLimitState:
+    limit: RateLimit
+    remaining: int
+    reset: int
+
+    def headers(self) -> Dict[str, str]:
+        return {
+            "RateLimit-Limit": str(self.limit.amount),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(self.reset),
+            "RateLimit-Policy": f"{self.limit.amount};w={self.limit.window}",
+        }
+
+
+def rate_limit_key(request: Request) -> str:
+    """``user:<id>`` for a request with a valid bearer token, else ``ip:<address>``.
+
+    Only the signature and expiry are checked, without touching the database;
+    a token that is revoked still identifies the user it was issued to.
+    """
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            sub = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm]).get("sub")
+        except JWTError:
+            sub = None
+        if sub is not None:
+            return f"user:{sub}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+class _LocalWindows:
+    """In-process fallback with the same sliding-window arithmetic."""
+
+    def __init__(self):
+        self._counts: Dict[Tuple[str, int], int] = {}
+        self._prune_at = 1024
+
+    def hit(self, key: str, index: int, limit: int, weight: float) -> Tuple[bool, int]:
+        current = self._counts.get((key, index), 0)
+        used = int(self._counts.get((key, index - 1), 0) * weight) + current
+        if used >= limit:
+            return False, used
+        self._counts[(key, index)] = current + 1
+        if len(self._counts) >= self._prune_at:
+            self._prune(index)
+        return True, used + 1
+
+    def _prune(self, index: int) -> None:
+        # Indexes belong to different window sizes, so this only keeps the
+        # dict from growing without bound; stale entries are harmless.
+        self._counts = {k: v for k, v in self._counts.items() if k[1] >= index - 1}
+        self._prune_at = max(1024, 2 * len(self._counts))
+
+
+class Limiter:
+    def __init__(self):
+        self._script = None
+        self._local = _LocalWindows()
+        self._redis_down_until = 0.0
+
+    def _hit_script(self):
+        if self._script is None:
+            self._script = FastAPICache.get_backend().redis.register_script(_HIT_LUA)
+        return self._script
+
+    async def hit(self, scope: str, key: str, limit: RateLimit) -> Tuple[bool, RateLimitState]:
+        now = time.time()
+        index, offset = divmod(now, limit.window)
+        index = int(index)
+        weight = 1 - offset / limit.window
+        name = f"{scope}:{limit.amount}/{limit.window}:{key}"
+
+        result = None
+        if now >= self._redis_down_until:
+            prefix = f"{FastAPICache.get_prefix()}:ratelimit:{name}"
+            try:
+                result = await self._hit_script()(
+                    keys=[f"{prefix}:{index}", f"{prefix}:{index - 1}"],
+                    args=[limit.amount, repr(weight), 2 * limit.window],
+                )
+            except Exception as e:
+                print(f"[limiter] Redis unavailable, using local limits for {_RETRY_REDIS_AFTER}s: {e}")
+                self._redis_down_until = now + _RETRY_REDIS_AFTER
+        if result is not None:
+            allowed, used = bool(result[0]), int(result[1])
+        else:
+            allowed, used = self._local.hit(name, index, limit.amount, weight)
+
+        reset = max(1, int((index + 1) * limit.window - now + 0.999))
+        return allowed, RateLimitState(limit, max(0, limit.amount - used), reset)
+
+    def limit(self, value: str):
+        """Limit the decorated endpoint to ``value`` (e.g. ``"5/minute"``) per client.
+
+        The endpoint must take a ``Request`` argument.
+        """
+        rate_limit = RateLimit.parse(value)
+
+        def decorator(func):
+            scope = f"{func.__module__}.{func.__qualname__}"
+
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                request = next(
+                    (v for v in (*args, *kwargs.values()) if isinstance(v, Request)), None
+                )
+                if request is None:
+                    raise RuntimeError(f"{scope} needs a Request argument to be rate limited")
+
+                allowed, state = await self.hit(scope, rate_limit_key(request), rate_limit)
+                request.state.rate_limit = state
+                if not allowed:
+                    raise HTTPException(
+                        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                        detail=f"Rate limit exceeded: {value}",
+                        headers={"Retry-After": str(state.reset)},
+                    )
+                return await func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+
+limiter = Limiter()
+
+
+class RateLimitHeadersMiddleware:
+    """Adds the ``RateLimit-*`` headers of the limit checked for a request to
+    its response."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                state: Optional[RateLimitState] = scope.get("state", {}).get("rate_limit")
+                if state is not None:
+                    message["headers"] = [
+                        *message.get("headers", []),
+                        *((k.lower().encode(), v.encode()) for k, v in state.headers().items()),
+                    ]
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -0,0 +1,50 @@
+import json
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.config import settings
+from app.core.cache import fill_token, get_items, set_items
+from app.models import User
+from app.schemas import UserOut
+
+# Authenticated users, cached so most requests resolve their principal
+# without touching the database. Entries live in the shared two-tier cache
+# (per-process LRU in front of Redis) under the "user:{id}" tag, so
+# ``invalidate(f"user:{id}")`` after any write to a user evicts them on every
+# worker. The password hash is never cached; token_version is, so token
+# revocation can be checked against it.
+#
+# A cached principal is rebuilt from its UserOut fields and merged into the
+# request's session without a query, so on both paths handlers get a User
+# persistent in their session. Only the cached columns are loaded; the rest
+# (the password hash) is expired, and handlers should still write users with
+# UPDATE statements so the cache is invalidated.
+
+NAMESPACE = "principals"
+
+
+def _detached(body: bytes) -> User:
+    data = json.loads(body)
+    token_version = data.pop("token_version", 0)
+    user = User(**UserOut.model_validate(data).model_dump(), token_version=token_version)
+    make_transient_to_detached(user)
+    return user
+
+
+async def load_principal(db: AsyncSession, user_id: int) -> Optional[User]:
+    cached = await get_items(NAMESPACE, [user_id])
+    if user_id in cached:
+        return await db.merge(_detached(cached[user_id]), load=False)
+
+    token = await fill_token()
+    user = await db.scalar(select(User).where(User.id == user_id))
+    if user is None:
+        return None
+
+    data = {**UserOut.model_validate(user).model_dump(mode="json"), "token_version": user.token_version}
+    body = json.dumps(data, separators=(",", ":")).encode()
+    await set_items(NAMESPACE, {user_id: (body, [f"user:{user_id}"])}, settings.principal_cache_ttl, token)
+    return user
@@ -0,0 +1,118 @@
+import asyncio
+import time
+from typing import Dict, Optional
+
+from fastapi_cache import FastAPICache
+
+# Access tokens carry the user's token_version ("ver") and a unique id
+# ("jti"). A token is revoked when its version is below the user's current
+# one ("sign out everywhere") or its jti was revoked on logout.
+#
+# Every worker answers that from memory. The state lives in Redis (a hash of
+# user versions and a sorted set of revoked jtis scored by token expiry), is
+# loaded whenever the subscription below is (re)established, and each change
+# is published so the other workers apply it immediately. Revoked jtis are
+# only kept until their token would have expired anyway. Until the first load
+# has finished nothing is known to be revoked, so ``loaded`` is set only then
+# and tokens are not accepted before it.
+
+_CHANNEL = "revocations"
+_VERSIONS = "token_versions"
+_REVOKED = "revoked_tokens"
+
+
+def _redis():
+    return FastAPICache.get_backend().redis
+
+
+def _key(name: str) -> str:
+    return f"{FastAPICache.get_prefix()}:{name}"
+
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class Revocations:
+    def __init__(self):
+        self._versions: Dict[int, int] = {}
+        self._revoked: Dict[str, float] = {}
+        self._prune_at = 1024
+        self.loaded = asyncio.Event()
+
+    def is_revoked(self, user_id: int, version: int, jti: Optional[str]) -> bool:
+        if version < self._versions.get(user_id, 0):
+            return True
+        if jti is None:
+            return False
+        expires_at = self._revoked.get(jti)
+        return expires_at is not None and expires_at > time.time()
+
+    def set_version(self, user_id: int, version: int) -> None:
+        if version > self._versions.get(user_id, 0):
+            self._versions[user_id] = version
+
+    def revoke(self, jti: str, expires_at: float) -> None:
+        self._revoked[jti] = expires_at
+        if len(self._revoked) >= self._prune_at:
+            self._prune()
+
+    def apply(self, message: str) -> None:
+        kind, key, value = message.split(" ")
+        if kind == "v":
+            self.set_version(int(key), int(value))
+        else:
+            self.revoke(key, float(value))
+
+    async def load(self) -> None:
+        now = time.time()
+        async with _redis().pipeline(transaction=False) as pipe:
+            pipe.hgetall(_key(_VERSIONS))
+            pipe.zremrangebyscore(_key(_REVOKED), "-inf", now)
+            pipe.zrange(_key(_REVOKED), 0, -1, withscores=True)
+            versions, _, revoked = await pipe.execute()
+        self._versions = {int(_text(k)): int(v) for k, v in versions.items()}
+        self._revoked = {_text(jti): expires_at for jti, expires_at in revoked}
+        self._prune()
+        self.loaded.set()
+
+    def _prune(self) -> None:
+        now = time.time()
+        self._revoked = {jti: exp for jti, exp in self._revoked.items() if exp > now}
+        self._prune_at = max(1024, 2 * len(self._revoked))
+
+
+revocations = Revocations()
+
+
+async def revoke_token(jti: str, expires_at: float) -> None:
+    revocations.revoke(jti, expires_at)
+    async with _redis().pipeline(transaction=False) as pipe:
+        pipe.zadd(_key(_REVOKED), {jti: expires_at})
+        pipe.publish(_key(_CHANNEL), f"t {jti} {expires_at}")
+        await pipe.execute()
+
+
+async def revoke_all(user_id: int, version: int) -> None:
+    """Revoke every token of ``user_id`` issued before ``version``."""
+    revocations.set_version(user_id, version)
+    async with _redis().pipeline(transaction=False) as pipe:
+        pipe.hset(_key(_VERSIONS), str(user_id), version)
+        pipe.publish(_key(_CHANNEL), f"v {user_id} {version}")
+        await pipe.execute()
+
+
+async def listen_for_revocations() -> None:
+    while True:
+        try:
+            pubsub = _redis().pubsub()
+            await pubsub.subscribe(_key(_CHANNEL))
+            await revocations.load()
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    revocations.apply(_text(message["data"]))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[revocation] Listener error: {e}")
+            await asyncio.sleep(1)
@@ -33,5 +33,5 @@ async def get_session() -> AsyncIterator[AsyncSession]:
         yield session
 
 async def init_cache():
-    redis = aioredis.from_url(REDIS_URL, encoding="utf8", decode_response=True)
+    redis = aioredis.from_url(REDIS_URL, encoding="utf8")
     FastAPICache.init(RedisBackend(redis), prefix="fastapi-cache")
\ No newline at end of file
@@ -4,7 +4,6 @@ from __future__ import annotations
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
 from jose import jwt, JWTError
 
 
@@ -12,32 +11,48 @@ from app.database import get_db
 from app.models import User, Role
 from app.schemas import TokenPayload
 from app.oauth2 import SECRET_KEY, ALGORITHM
+from app.core.principals import load_principal
+from app.core.revocation import revocations
 
 
 # For Swagger login flow (tokenUrl must match our login endpoint)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: AsyncSession = Depends(get_db),
-) -> User:
-    credentials_exception = HTTPException(
+def credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
-)
+    )
+
+
+async def get_token_payload(token: str = Depends(oauth2_scheme)) -> TokenPayload:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         data = TokenPayload(**payload)
     except (JWTError, ValueError):
-        raise credentials_exception
+        raise credentials_exception()
+    
+    if not revocations.loaded.is_set():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Token revocations are not loaded yet, try again shortly",
+            headers={"Retry-After": "1"},
+        )
+    if revocations.is_revoked(data.sub, data.ver, data.jti):
+        raise credentials_exception()
+    return data
 
 
-    result = await db.execute(select(User).where(User.id == data.sub))
-    user = result.scalar_one_or_none()
-    if not user:
-        raise credentials_exception
+async def get_current_user(
+    data: TokenPayload = Depends(get_token_payload),
+    db: AsyncSession = Depends(get_db),
+) -> User:
+    user = await load_principal(db, data.sub)
+    # The stored version also catches revocations this worker has not heard of.
+    if not user or data.ver < user.token_version:
+        raise credentials_exception()
     return user
 
 
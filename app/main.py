@@ -2,16 +2,20 @@ from fastapi import FastAPI
 import asyncio
 from .models import Base
 from .database import engine, init_cache
-from .routers import auth, register, book, borrow_book, notification, users, ws_notification
+from .routers import auth, register, book, borrow_book, holds, notification, users, ws_notification
 from .services.scheduler import scheduler_loop
-from .core.limiter import limiter, rate_limit_handler
+from .services.suggest import listen_for_suggestions
+from .core.limiter import RateLimitHeadersMiddleware
+from .core.cache import listen_for_invalidations
+from .core.hashing import shutdown_hash_pool
+from .core.revocation import listen_for_revocations, revocations
+from .services.unread import listen_for_unread_counts
 
 
 app = FastAPI(title="Library Management API", version="0.1.0")
 
 
-app.state.limiter = limiter
-app.add_exception_handler(429, rate_limit_handler)
+app.add_middleware(RateLimitHeadersMiddleware)
 
 
 @app.get("/")
@@ -23,14 +27,29 @@ async def on_startup():
     async with engine.begin() as conn:
         await conn.run_sync(lambda sync_conn: Base.metadata.create_all(bind=sync_conn))
     
+    await init_cache()
     asyncio.create_task(scheduler_loop())
+    asyncio.create_task(listen_for_invalidations())
+    asyncio.create_task(listen_for_revocations())
+    asyncio.create_task(listen_for_unread_counts())
+    asyncio.create_task(listen_for_suggestions())
     
-    await init_cache()
+    # Start serving once revoked tokens are known; if Redis is slow to answer,
+    # authenticated requests get a 503 until they are.
+    try:
+        await asyncio.wait_for(revocations.loaded.wait(), timeout=10)
+    except asyncio.TimeoutError:
+        print("[revocation] Revocations not loaded yet, rejecting tokens until they are")
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    shutdown_hash_pool()
 
 app.include_router(auth.router)
 app.include_router(register.router)
 app.include_router(book.router)
 app.include_router(borrow_book.router)
+app.include_router(holds.router)
 app.include_router(users.router)
 app.include_router(notification.router)
 app.include_router(ws_notification.router)
\ No newline at end of file
@@ -1,5 +1,5 @@
 from .database import Base
-from sqlalchemy import Column, Integer, String, Boolean, null, text, ForeignKey, Enum as SAEnum, Date, DateTime, func, Text
+from sqlalchemy import Column, Integer, String, Boolean, null, text, ForeignKey, Enum as SAEnum, Date, DateTime, func, Text, Index, DDL, event, CheckConstraint
 from sqlalchemy.sql.sqltypes import TIMESTAMP
 from sqlalchemy.orm import Mapped, mapped_column, relationship, aliased
 from sqlalchemy.ext.hybrid import hybrid_property
@@ -26,20 +26,38 @@ class NotificationType(str, enum.Enum):
     System = "System"
 
 
+class HoldStatus(str, enum.Enum):
+    Waiting = "Waiting"
+    Ready = "Ready"
+    Fulfilled = "Fulfilled"
+    Cancelled = "Cancelled"
+    Expired = "Expired"
+
+
 class NotificationPreference(str, enum.Enum):
     WEBSOCKET = "WEBSOCKET" 
     EMAIL = "EMAIL"         
     ALL = "ALL"  
 
+# Trigram indexes below (search on titles, names and emails) need pg_trgm.
+event.listen(Base.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+
+
 class User(Base):
     
     __tablename__ = "users"
+    __table_args__ = (
+        Index("ix_users_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+        Index("ix_users_email_trgm", "email", postgresql_using="gin", postgresql_ops={"email": "gin_trgm_ops"}),
+    )
     
     id: Mapped[int] = mapped_column(Integer,primary_key=True, nullable=False)
     name: Mapped[str] = mapped_column(String(60), nullable=False)
     email: Mapped[str] = mapped_column(String(255), unique=True, index=True, nullable=False)
     password: Mapped[str] = mapped_column(String(80), nullable=False)
     role: Mapped[Role] = mapped_column(SAEnum(Role, create_constraint=True), nullable=False)
+    # Tokens carry the version they were issued under; bumping it revokes them all.
+    token_version: Mapped[int] = mapped_column(Integer, default=0, server_default=text("0"), nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(),nullable=False)
     bio: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     birthdate: Mapped[Optional[date]] = mapped_column(Date, nullable=True)
@@ -57,6 +75,13 @@ class User(Base):
 class Book(Base):
     
     __tablename__ = "books"
+    __table_args__ = (
+        # Keyset pagination orders (GET /books?cursor=...)
+        Index("ix_books_created_at_id", "created_at", "id"),
+        Index("ix_books_title_id", "title", "id"),
+        Index("ix_books_title_trgm", "title", postgresql_using="gin", postgresql_ops={"title": "gin_trgm_ops"}),
+        CheckConstraint("available_count >= 0 AND available_count <= total_copies", name="ck_books_available_count"),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True, nullable=False)
     isbn: Mapped[str] = mapped_column(String(13), unique=True, index=True, nullable=True)
@@ -66,6 +91,11 @@ class Book(Base):
     status: Mapped[BookStatus] = mapped_column(SAEnum(BookStatus, create_constraint=True), default=BookStatus.Available, nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(),nullable=False)
     
+    # Inventory: available_count is denormalized and only ever changed by
+    # conditional UPDATEs on borrow/return, never recomputed from borrow_records.
+    total_copies: Mapped[int] = mapped_column(Integer, default=1, server_default=text("1"), nullable=False)
+    available_count: Mapped[int] = mapped_column(Integer, default=1, server_default=text("1"), nullable=False)
+    
     author_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), index=True, nullable=False)
     author: Mapped["User"] = relationship(back_populates="books_uploaded")
     borrow_records: Mapped[List["BorrowRecord"]] = relationship(
@@ -79,6 +109,16 @@ class Book(Base):
 class BorrowRecord(Base):
     
     __tablename__ = "borrow_records"
+    __table_args__ = (
+        # At most one open loan per member and title; borrows rely on it
+        # (ON CONFLICT DO NOTHING) instead of a check-then-insert.
+        Index("uq_borrow_records_open", "user_id", "book_id", unique=True,
+              postgresql_where=text("returned_at IS NULL")),
+        # The hot paths only look at open loans, which stay a small slice of
+        # the table: the active list, the overdue list and the scheduler scan.
+        Index("ix_borrow_records_open_borrowed_at", "borrowed_at", "id", postgresql_where=text("returned_at IS NULL")),
+        Index("ix_borrow_records_open_due_at", "due_at", postgresql_where=text("returned_at IS NULL")),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True, nullable=False)
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), index=True, nullable=False)
@@ -95,14 +135,73 @@ class BorrowRecord(Base):
     user: Mapped["User"] = relationship(back_populates="borrow_records")
     book: Mapped["Book"] = relationship(back_populates="borrow_records")
 
+
+class BorrowRecordArchive(Base):
+    """Returned loans moved out of borrow_records by the archival job.
+
+    Same columns as BorrowRecord, but never updated once written, so it only
+    needs the index behind a member's history.
+    """
+    
+    __tablename__ = "borrow_records_archive"
+    __table_args__ = (
+        Index("ix_borrow_records_archive_user_borrowed", "user_id", "borrowed_at"),
+    )
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False, nullable=False)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    book_id: Mapped[int] = mapped_column(Integer, ForeignKey("books.id", ondelete="CASCADE"), index=True, nullable=False)
+    
+    borrowed_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    due_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    returned_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    
+    reminder_sent_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    overdue_notified: Mapped[bool] = mapped_column(Boolean, nullable=False)
+
 class Notification(Base):
     __tablename__ = "notifications"
+    __table_args__ = (
+        # Inbox pages, newest first, keyed on (created_at, id); also covers
+        # every other lookup by user.
+        Index("ix_notifications_user_created_at_id", "user_id", "created_at", "id"),
+        # Unread notifications are a small slice of each inbox: the unread
+        # filter, read-all and the unread count only scan this.
+        Index("ix_notifications_unread_user_created_at_id", "user_id", "created_at", "id",
+              postgresql_where=text("NOT is_read")),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
-    user_id: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True, nullable=True)
+    user_id: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True)
     message: Mapped[str] = mapped_column(String, nullable=False)
     type: Mapped[NotificationType] = mapped_column(SAEnum(NotificationType, create_constraint=True), default=NotificationType.Reminder, nullable=False)
     is_read: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
     user = relationship("User", back_populates="notifications")
+
+
+class Hold(Base):
+    """A member's place in the queue for a title with no copy on the shelf.
+
+    Waiting holds are served in (created_at, id) order. A returned copy goes
+    to the first one, which becomes Ready and keeps that copy out of
+    available_count until it is borrowed or ``expires_at`` passes.
+    """
+    
+    __tablename__ = "holds"
+    __table_args__ = (
+        Index("uq_holds_active", "user_id", "book_id", unique=True,
+              postgresql_where=text("status IN ('Waiting', 'Ready')")),
+        Index("ix_holds_queue", "book_id", "created_at", "id", postgresql_where=text("status = 'Waiting'")),
+        Index("ix_holds_ready_expires_at", "expires_at", postgresql_where=text("status = 'Ready'")),
+    )
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, nullable=False)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True, nullable=False)
+    book_id: Mapped[int] = mapped_column(Integer, ForeignKey("books.id", ondelete="CASCADE"), nullable=False)
+    status: Mapped[HoldStatus] = mapped_column(SAEnum(HoldStatus, create_constraint=True), default=HoldStatus.Waiting, nullable=False)
+    
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    ready_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    expires_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
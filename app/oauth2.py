@@ -1,3 +1,4 @@
+import uuid
 from jose import jwt
 from datetime import datetime, timedelta, timezone
 from .config import settings
@@ -12,6 +13,6 @@ def create_access_token(subject: Dict[str, Any], expires_delta: Optional[timedel
     if expires_delta is None:
         expires_delta = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     expire = datetime.now(timezone.utc) + expires_delta
-    to_encode = {**subject, "exp": int(expire.timestamp())}
+    to_encode = {**subject, "exp": int(expire.timestamp()), "jti": uuid.uuid4().hex}
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
@@ -0,0 +1,47 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from typing import Any, Callable, List, Sequence
+
+from fastapi import HTTPException, status
+from sqlalchemy import tuple_
+
+
+def encode_cursor(kind: str, values: Sequence[Any]) -> str:
+    """Pack the sort key of the last row of a page into an opaque token."""
+    payload = [kind, *(v.isoformat() if isinstance(v, (datetime, date)) else v for v in values)]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, kind: str, types: Sequence[Callable[[Any], Any]]) -> List[Any]:
+    """Unpack a token from ``encode_cursor``, converting each value with ``types``."""
+    invalid = HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+    except (binascii.Error, ValueError):
+        raise invalid
+
+    if not isinstance(payload, list) or len(payload) != len(types) + 1 or payload[0] != kind:
+        raise invalid
+    try:
+        return [convert(value) for convert, value in zip(types, payload[1:])]
+    except (TypeError, ValueError):
+        raise invalid
+
+
+def keyset_after(columns: Sequence[Any], values: Sequence[Any], descending: bool = False):
+    """Row-value predicate selecting rows that sort strictly after ``values``.
+
+    Every column must share the same direction so the comparison can be served
+    by a single composite index on ``columns``.
+    """
+    if descending:
+        return tuple_(*columns) < tuple_(*values)
+    return tuple_(*columns) > tuple_(*values)
+
+
+def keyset_order(columns: Sequence[Any], descending: bool = False) -> List[Any]:
+    return [c.desc() if descending else c.asc() for c in columns]
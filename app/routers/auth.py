@@ -1,18 +1,20 @@
 #from __future__ import annotations
 
 
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update
 from fastapi.concurrency import run_in_threadpool
 
 from app.database import get_db
 from app.models import User
-from app.schemas import UserOut,Token
-from app.utils import verify_password
+from app.schemas import UserOut,Token, TokenPayload
+from app.core.hashing import verify_password_async
 from app.oauth2 import create_access_token
-from app.dependencies import get_current_user
+from app.dependencies import get_current_user, get_token_payload
+from app.core.cache import invalidate
+from app.core.revocation import revoke_token, revoke_all
 from app.core.limiter import limiter
 
 
@@ -31,10 +33,57 @@ async def login(
     
     result = await db.execute(select(User).where(User.email == form.username))
     user = result.scalar_one_or_none()
-    if not user or not verify_password(form.password, user.password):
+    if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect email or password")
+    
+    verified, new_hash = await verify_password_async(form.password, user.password)
+    if not verified:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect email or password")
+    
+    if new_hash:
+        # pwd_context settings changed since this hash was made; upgrade it.
+        user.password = new_hash
+        await db.commit()
 
-    token_data = {"sub": str(user.id), "role": user.role.value}
+    token_data = {"sub": str(user.id), "role": user.role.value, "ver": user.token_version}
     token = create_access_token(token_data)
     return Token(access_token=token)
 
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(
+    payload: TokenPayload = Depends(get_token_payload),
+    db: AsyncSession = Depends(get_db),
+    ):
+    
+    if payload.jti is None:
+        # Issued before tokens had ids; the only way to revoke it is all of them.
+        await revoke_all_sessions(db, payload.sub)
+    else:
+        await revoke_token(payload.jti, payload.exp)
+    
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+@router.post("/logout/all", status_code=status.HTTP_204_NO_CONTENT)
+async def logout_everywhere(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    ):
+    
+    await revoke_all_sessions(db, current_user.id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+async def revoke_all_sessions(db: AsyncSession, user_id: int) -> None:
+    version = await db.scalar(
+        update(User)
+        .where(User.id == user_id)
+        .values(token_version=User.token_version + 1)
+        .returning(User.token_version)
+    )
+    if version is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    await db.commit()
+    
+    await revoke_all(user_id, version)
+    await invalidate(f"user:{user_id}")
@@ -1,17 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Response, Request, Query
-from fastapi_cache.decorator import cache
-from fastapi_cache import FastAPICache
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Response, Request, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
-from sqlalchemy import or_, func
-from typing import List, Optional
+from sqlalchemy import or_, func, any_, literal, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
+from typing import Dict, List, Optional, Sequence, Union
+from datetime import datetime
 
 from app.database import get_db
 from app.models import Book, User, Role
 from .. import schemas
 from ..dependencies import role_required, get_current_user
 from ..core.limiter import limiter
+from ..core.cache import cached, conditional, invalidate, fill_token, get_items, set_items
+from ..pagination import encode_cursor, decode_cursor, keyset_after, keyset_order
+from ..services.search import book_search_clause, book_rank
+from ..services.suggest import suggest_index, publish_suggestions, BOOK
+from ..services.catalog_import import CatalogImport, CSV, NDJSON
+from ..services.export import export_response
+from ..services.inventory import resize_inventory
+from ..services.holds import fill_statement, notify_ready
+from ..services.notification import dispatch_notification_task
 
 
 router = APIRouter(
@@ -19,6 +28,74 @@ router = APIRouter(
     tags=["Books"]
 )
 
+# sort -> (key columns, descending, cursor value parsers)
+BOOK_KEYSETS = {
+    schemas.BookSort.created: ((Book.created_at, Book.id), True, (datetime.fromisoformat, int)),
+    schemas.BookSort.title: ((Book.title, Book.id), False, (str, int)),
+}
+
+MAX_IDS = 100
+# Single-book entries are dropped by the "book:{id}" tag on every write, so
+# they can live much longer than list pages.
+BOOK_ITEM_EXPIRE = 600
+
+
+def parse_ids(ids: str) -> List[int]:
+    try:
+        parsed = list(dict.fromkeys(int(i) for i in ids.split(",") if i.strip()))
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="ids must be comma-separated integers")
+    if not parsed or len(parsed) > MAX_IDS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Pass between 1 and {MAX_IDS} ids")
+    return parsed
+
+
+async def load_books(db: AsyncSession, ids: Sequence[int]) -> Dict[int, bytes]:
+    """Serialized BookOut bodies by id, read through the per-book cache.
+
+    Hits come from one Redis MGET and misses from one ``id = ANY(...)`` query;
+    ids that do not exist are left out.
+    """
+    bodies = await get_items("books", ids)
+    missing = [id for id in ids if id not in bodies]
+    if not missing:
+        return bodies
+    
+    token = await fill_token()
+    result = await db.execute(
+        select(Book)
+        .options(selectinload(Book.author))
+        .where(Book.id == any_(literal(missing, ARRAY(Integer))))
+    )
+    fresh = {
+        book.id: (schemas.BookOut.model_validate(book).model_dump_json().encode(), [f"book:{book.id}"])
+        for book in result.scalars().all()
+    }
+    await set_items("books", fresh, BOOK_ITEM_EXPIRE, token)
+    bodies.update({id: body for id, (body, _) in fresh.items()})
+    return bodies
+
+
+def book_list_tags(params, data):
+    """Cache dependencies of a GET /books page.
+
+    Every page depends on the books it contains. Beyond that, a new book can
+    only shift offset pages, the first created-order page, title-ordered pages
+    and search results; deeper created-order cursor pages stay valid.
+    """
+    items = data["items"] if isinstance(data, dict) else data
+    tags = [f"book:{item['id']}" for item in items]
+    
+    if params.get("search"):
+        tags.append("books:search")
+    if params.get("cursor") is None:
+        tags.append("books:offset")
+    elif params["sort"] == schemas.BookSort.title:
+        tags.append("books:title")
+    elif not params["cursor"]:
+        tags.append("books:created:head")
+    return tags
+
 
 @router.post("/", response_model=schemas.BookOut)
 async def upload_book(
@@ -27,49 +104,149 @@ async def upload_book(
     current_user: User = Depends(role_required(Role.Author))
     ):    
     
-    new_book = Book(**book.model_dump(), author_id=current_user.id)
+    new_book = Book(**book.model_dump(), available_count=book.total_copies, author_id=current_user.id)
     db.add(new_book)
     await db.commit()
     await db.refresh(new_book)
     
-    await FastAPICache.clear(namespace="books")
+    await invalidate("books:offset", "books:created:head", "books:title", "books:search")
+    await publish_suggestions(add=[(BOOK, new_book.id, new_book.title)])
     
     return new_book
 
-@router.get("/", response_model=List[schemas.BookOut])
+@router.post("/import", response_model=schemas.BookImportResult)
+async def import_books(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(role_required(Role.Author, Role.Librarian)),
+    author_id: Optional[int] = Query(None, description="Author of the imported books; required for librarians, authors import their own")
+    ):
+    
+    if current_user.role == Role.Author:
+        if author_id is not None and author_id != current_user.id:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Authors can only import their own books")
+        author_id = current_user.id
+    elif author_id is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="author_id is required")
+    elif await db.scalar(select(User.id).where(User.id == author_id, User.role == Role.Author)) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Author not found")
+    
+    content_type = request.headers.get("content-type", "")
+    if "csv" in content_type:
+        format = CSV
+    elif "json" in content_type:
+        format = NDJSON
+    else:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                            detail="Send text/csv or application/x-ndjson")
+    
+    job = CatalogImport(db, author_id=author_id)
+    try:
+        return await job.run(request.stream(), format)
+    finally:
+        if job.inserted:
+            await invalidate("books:offset", "books:created:head", "books:title", "books:search")
+
+@router.get("/export")
+async def export_books(
+    _: User = Depends(get_current_user),
+    format: schemas.ExportFormat = Query(schemas.ExportFormat.ndjson),
+    search: Optional[str] = Query(None, description="Search by title or name of author")
+    ):
+    
+    stmt = (
+        select(
+            Book.id, Book.isbn, Book.title, Book.description, Book.published_date,
+            Book.status, Book.total_copies, Book.available_count, Book.created_at,
+            Book.author_id, User.name.label("author_name")
+        )
+        .join(User, Book.author_id == User.id)
+        .order_by(Book.id)
+    )
+    if search:
+        stmt = stmt.where(book_search_clause(search))
+    
+    return export_response(stmt, format, "books")
+
+@router.get("/", response_model=Union[List[schemas.BookOut], schemas.BookPage])
 @limiter.limit("20/minute")
-@cache(expire=30, namespace="books")
+@conditional(lambda params, user: ["book", "books"])
+@cached(namespace="books", expire=30, model=Union[List[schemas.BookOut], schemas.BookPage], tags=book_list_tags,
+        stale_while_revalidate=30, unless=lambda params: params.get("ids") is not None)
 async def get_all_books(
     request: Request,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
     search: Optional[str] = Query(None, description="Search by title or name of author"),
     limit: int = Query(10, ge=1, le=100),
-    skip: int = Query(0, ge=0)
+    skip: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="Keyset paging: pass an empty value for the first page, then each page's next_cursor"),
+    sort: schemas.BookSort = Query(schemas.BookSort.created, description="Ordering used with cursor"),
+    ids: Optional[str] = Query(None, description="Comma-separated book ids to fetch; other filters are ignored")
     ):
     
+    if ids is not None:
+        wanted = parse_ids(ids)
+        bodies = await load_books(db, wanted)
+        content = b"[" + b",".join(bodies[id] for id in wanted if id in bodies) + b"]"
+        return Response(content=content, media_type="application/json")
+    
     query = select(Book).options(selectinload(Book.author))
 
     if search:
-        search_term = f"%{search}%"
-        query = query.where(
-            or_(
-                Book.title.ilike(search_term),
-                Book.author.has(User.name.ilike(search_term))
-            )
-        )
+        query = query.where(book_search_clause(search))
     
     #total = await db.scalar(select(func.count()).select_from(query.subquery()))
     
-    query = query.offset(skip).limit(limit)
+    if cursor is None:
+        if search:
+            query = query.order_by(book_rank(search).desc(), Book.id)
+        query = query.offset(skip).limit(limit)
+        result = await db.execute(query)
+        books = result.scalars().unique().all()
+        
+        return books
+    
+    columns, descending, types = BOOK_KEYSETS[sort]
+    if cursor:
+        query = query.where(keyset_after(columns, decode_cursor(cursor, sort.value, types), descending))
+    
+    query = query.order_by(*keyset_order(columns, descending)).limit(limit + 1)
     result = await db.execute(query)
     books = result.scalars().unique().all()
     
-    return books
+    next_cursor = None
+    if len(books) > limit:
+        books = books[:limit]
+        next_cursor = encode_cursor(sort.value, [getattr(books[-1], c.key) for c in columns])
+    
+    return schemas.BookPage(items=books, next_cursor=next_cursor)
+
+@router.get("/suggest", response_model=List[schemas.Suggestion])
+async def suggest_books(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=25),
+    _: User = Depends(get_current_user)
+    ):
+    
+    return [
+        schemas.Suggestion(kind=kind, id=id, label=label)
+        for kind, id, label in suggest_index.suggest(q, limit)
+    ]
+
+@router.get("/{id}", response_model=schemas.BookOut)
+@conditional(lambda params, user: ["book"])
+async def get_book(id: int, db: AsyncSession = Depends(get_db), _: User = Depends(get_current_user)):
+    
+    bodies = await load_books(db, [id])
+    if id not in bodies:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
+    
+    return Response(content=bodies[id], media_type="application/json")
 
 @router.patch("/{id}", response_model=schemas.BookOut)
-async def update_book(id: int, book_update: schemas.BookUpdate, db: AsyncSession = Depends(get_db), 
-                    _: bool = Depends(role_required(Role.Author))):
+async def update_book(id: int, book_update: schemas.BookUpdate, background_tasks: BackgroundTasks,
+                    db: AsyncSession = Depends(get_db), _: bool = Depends(role_required(Role.Author))):
     
     result = await db.execute(select(Book).where(Book.id == id))
     book = result.scalars().first()
@@ -77,13 +254,31 @@ async def update_book(id: int, book_update: schemas.BookUpdate, db: AsyncSession
     if not book:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
     
-    for key, value in book_update.model_dump(exclude_unset=True).items():
+    changes = book_update.model_dump(exclude_unset=True)
+    total_copies = changes.pop("total_copies", None)
+    for key, value in changes.items():
         setattr(book, key, value)
+    
+    promotions = []
+    if total_copies is not None:
+        resized = await db.execute(resize_inventory(id, total_copies))
+        if resized.first() is None:
+            await db.rollback()
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Copies on loan cannot be removed")
+        # Added copies go to the hold queue before the shelf.
+        promotions = [tuple(row) for row in await db.execute(fill_statement(id))]
         
     await db.commit()
     await db.refresh(book)
     
-    await FastAPICache.clear(namespace="books")
+    tags = [f"book:{id}"]
+    if "title" in changes:
+        tags += ["books:title", "books:search"]
+    await invalidate(*tags)
+    if "title" in changes:
+        await publish_suggestions(add=[(BOOK, book.id, book.title)])
+    for args in await notify_ready(db, promotions):
+        background_tasks.add_task(dispatch_notification_task, *args)
     
     return book
 
@@ -99,6 +294,7 @@ async def delete_book(id: int, db: AsyncSession = Depends(get_db), _: bool = Dep
     await db.delete(result)
     await db.commit()
     
-    await FastAPICache.clear(namespace="books")
+    await invalidate(f"book:{id}", "books:offset")
+    await publish_suggestions(remove=[(BOOK, id)])
     
     return Response(status_code=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
@@ -1,136 +1,213 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request
-from fastapi_cache.decorator import cache
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Request, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
-from typing import List
-from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+from datetime import datetime, timezone
 
 from app.database import get_db
 from app.models import Book, User, Role, BorrowRecord, BookStatus
 from .. import schemas
 from ..dependencies import role_required, get_current_user
 from ..core.limiter import limiter
+from ..core.cache import cached, conditional, invalidate
+from ..pagination import encode_cursor, decode_cursor
+from ..services.export import export_response
+from ..services.holds import notify_ready
+from ..services.notification import dispatch_notification_task
+from ..services.circulation import (
+    borrow_statement, return_statement, borrow_failure, loan_out, due_date, checkout_batch, return_batch,
+    borrow_history, loan_projection, active_loans_statement
+)
 
 router = APIRouter(
     prefix="/borrow_book",
     tags=["Borrow Book"]
 )
 
-@router.post("/{id}", response_model=schemas.BorrowBook)
+def my_borrow_tags(params, data):
+    return [f"borrows:user:{params['user_id']}", *(f"book:{loan['book_id']}" for loan in data)]
+
+
+def active_borrow_tags(params, data):
+    """Any borrow or return can move a page or its summary, so every page
+    drops on borrows:active; the per-book tags catch edits to the books it
+    shows."""
+    return ["borrows:active", *(f"book:{loan['book_id']}" for loan in data["items"])]
+
+
+def summary_clock() -> datetime:
+    """The start of the current minute. The active-loan summary is counted as
+    of this instant, and being an endpoint argument it is part of the cache
+    key and ETag, so due_today and overdue never lag the clock by more than a
+    minute even when nothing is written."""
+    return datetime.now(timezone.utc).replace(second=0, microsecond=0)
+
+
+def loan_tags(user_id, book_ids):
+    return ["borrows:active", f"borrows:user:{user_id}", *(f"book:{book_id}" for book_id in book_ids)]
+
+
+@router.post("/batch", response_model=schemas.BorrowBatchResult)
 @limiter.limit("5/minute")
-async def borrow_book(
+async def borrow_books(
     request: Request,
-    id: int, db: AsyncSession = Depends(get_db),
+    batch: schemas.BorrowBatch,
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(role_required(Role.Member))):
     
-    result = await db.execute(select(Book).options(selectinload(Book.author)).where(Book.id == id))
-    book = result.scalars().first()
+    result = await checkout_batch(db, current_user.id, batch.book_ids, batch.all_or_nothing)
     
-    if not book:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
+    if result.succeeded:
+        await invalidate(*loan_tags(current_user.id, [item.book_id for item in result.items if item.ok]))
     
-    active = await db.execute(select(BorrowRecord).where(BorrowRecord.book_id == id, BorrowRecord.returned_at.is_(None)))
-    borrow = active.scalars().first()
+    return result
+
+
+@router.post("/batch/return", response_model=schemas.BorrowBatchResult)
+@limiter.limit("5/minute")
+async def return_books(
+    request: Request,
+    batch: schemas.BorrowBatch,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(role_required(Role.Member))):
     
-    if borrow:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Book already borrowed")
+    result, promotions = await return_batch(db, current_user.id, batch.book_ids, batch.all_or_nothing)
     
-    borrowed = BorrowRecord(
-        user_id = current_user.id,
-        book_id = id,
-        due_at = datetime.now(timezone.utc) + timedelta(days=14)
-    )
-    db.add(borrowed)
+    if result.succeeded:
+        await invalidate(*loan_tags(current_user.id, [item.book_id for item in result.items if item.ok]))
+    for args in await notify_ready(db, promotions):
+        background_tasks.add_task(dispatch_notification_task, *args)
     
-    book.status = BookStatus.Borrowed
-    await db.commit()
+    return result
+
+
+@router.post("/{id}", response_model=schemas.BorrowBook)
+@limiter.limit("5/minute")
+async def borrow_book(
+    request: Request,
+    id: int, db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(role_required(Role.Member))):
     
-    result = await db.execute(
-        select(BorrowRecord).
-        options(
-            selectinload(BorrowRecord.book).selectinload(Book.author),
-            selectinload(BorrowRecord.user)
-            )
-        .where(BorrowRecord.id == borrowed.id)
-        )
-    new_borrow_record = result.scalars().first()
+    result = await db.execute(borrow_statement(current_user.id, id, due_date()))
+    row = result.first()
     
-    return new_borrow_record
+    if row is None:
+        # The claim may have applied without the loan; undo it, then explain.
+        await db.rollback()
+        raise await borrow_failure(db, current_user.id, id)
+    
+    await db.commit()
+    await invalidate(*loan_tags(current_user.id, [id]))
+    
+    return loan_out(row)
 
 
-@router.patch("/{id}/return")
+@router.patch("/{id}/return", response_model=schemas.BorrowBook)
 @limiter.limit("5/minute")
 async def return_book(
     request: Request,
     id: int, 
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(role_required(Role.Member))):
     
-    result = await db.execute(
-        select(BorrowRecord)
-        .options(selectinload(BorrowRecord.book))
-        .where(
-            BorrowRecord.book_id == id, 
-            BorrowRecord.user_id == current_user.id, 
-            BorrowRecord.returned_at.is_(None)
-        )
-        .order_by(BorrowRecord.borrowed_at.desc()) 
-    )
-    borrow = result.scalars().first()
+    result = await db.execute(return_statement(current_user.id, id, datetime.now(timezone.utc)))
+    row = result.first()
     
-    if not borrow:
+    if row is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No active borrow record found")
     
-    borrow.returned_at = datetime.now(timezone.utc)
-    borrow.book.status = BookStatus.Available
-    
     await db.commit()
+    await invalidate(*loan_tags(current_user.id, [id]))
     
-    result = await db.execute(select(BorrowRecord).options(
-        selectinload(BorrowRecord.book),
-        ).where(BorrowRecord.id == borrow.id)
-    )
-    updated_borrow = result.scalars().first()
+    if row.hold_user_id is not None:
+        promotions = [(row.hold_user_id, row.book__title, row.hold_expires_at)]
+        for args in await notify_ready(db, promotions):
+            background_tasks.add_task(dispatch_notification_task, *args)
     
-    return updated_borrow
+    return loan_out(row)
 
 
 @router.get("/me", response_model=List[schemas.BorrowBook])
-@cache(expire=10)
+@conditional(lambda params, user: ["book", "borrows"])
+@cached(namespace="borrows", expire=3600, model=List[schemas.BorrowBook], tags=my_borrow_tags, per_user=True)
 async def get_my_borrows(
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(role_required(Role.Member))):
     
-    query = await db.execute(
-        select(BorrowRecord)
-        .options(
-            selectinload(BorrowRecord.book).selectinload(Book.author),
-            selectinload(BorrowRecord.user)
-        )
-        .where(BorrowRecord.user_id == current_user.id)
-        .order_by(BorrowRecord.borrowed_at.desc())
+    history = borrow_history(current_user.id)
+    result = await db.execute(
+        loan_projection(history, Book.__table__)
+        .order_by(history.c.borrowed_at.desc())
     )
     
-    result = query.scalars().all()
-    return result
+    return [loan_out(row) for row in result]
 
-@router.get("/active", response_model=List[schemas.BorrowInfo])
-@cache(expire=10)
+@router.get("/active", response_model=schemas.ActiveBorrowPage)
+@conditional(lambda params, user: ["book", "borrows"])
+@cached(namespace="borrows", expire=60, model=schemas.ActiveBorrowPage, tags=active_borrow_tags)
 async def get_active_borrows(
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(role_required(Role.Librarian))):
-    
-    result = await db.execute(
-        select(BorrowRecord)
-        .options(
-            selectinload(BorrowRecord.book).selectinload(Book.author),
-            selectinload(BorrowRecord.user)
-        )
-        .where(BorrowRecord.returned_at.is_(None))
-        .order_by(BorrowRecord.borrowed_at.desc())
+    current_user: User = Depends(role_required(Role.Librarian)),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    user_id: Optional[int] = Query(None),
+    book_id: Optional[int] = Query(None),
+    due_after: Optional[datetime] = Query(None),
+    due_before: Optional[datetime] = Query(None),
+    as_of: datetime = Depends(summary_clock)):
+    
+    criteria = []
+    if user_id is not None:
+        criteria.append(BorrowRecord.user_id == user_id)
+    if book_id is not None:
+        criteria.append(BorrowRecord.book_id == book_id)
+    if due_after is not None:
+        criteria.append(BorrowRecord.due_at >= due_after)
+    if due_before is not None:
+        criteria.append(BorrowRecord.due_at < due_before)
+    
+    after = decode_cursor(cursor, "active", (datetime.fromisoformat, int)) if cursor else None
+    result = await db.execute(active_loans_statement(criteria, after, limit + 1, as_of))
+    rows = result.all()
+    
+    items = [
+        {**loan_out(row), "user": {"name": row.user__name, "email": row.user__email}}
+        for row in rows if row.id is not None
+    ]
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor("active", [items[-1]["borrowed_at"], items[-1]["id"]])
+    
+    summary = schemas.LoanSummary(open=rows[0].open, due_today=rows[0].due_today, overdue=rows[0].overdue)
+    return schemas.ActiveBorrowPage(items=items, next_cursor=next_cursor, summary=summary)
+
+
+@router.get("/export")
+async def export_borrows(
+    _: User = Depends(role_required(Role.Librarian)),
+    format: schemas.ExportFormat = Query(schemas.ExportFormat.ndjson),
+    active: Optional[bool] = Query(None, description="Only open (true) or only returned (false) loans"),
+    user_id: Optional[int] = Query(None)
+    ):
+    
+    # Open loans are never archived, so only history needs the archive too.
+    loans = BorrowRecord.__table__ if active else borrow_history(user_id)
+    stmt = (
+        select(
+            loans.c.id, loans.c.user_id, User.name.label("user_name"), User.email.label("user_email"),
+            loans.c.book_id, Book.title.label("book_title"),
+            loans.c.borrowed_at, loans.c.due_at, loans.c.returned_at
         )
+        .join(User, loans.c.user_id == User.id)
+        .join(Book, loans.c.book_id == Book.id)
+        .order_by(loans.c.id)
+    )
+    if active is not None:
+        stmt = stmt.where(loans.c.returned_at.is_(None) if active else loans.c.returned_at.is_not(None))
+    if user_id is not None:
+        stmt = stmt.where(loans.c.user_id == user_id)
     
-    borrows = result.scalars().all()
-    
-    return borrows
\ No newline at end of file
+    return export_response(stmt, format, "borrow_records")
\ No newline at end of file
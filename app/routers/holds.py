@@ -0,0 +1,77 @@
+from fastapi import APIRouter, BackgroundTasks, Depends, status, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from typing import List
+
+from app.database import get_db
+from app.models import User, Role, Hold, HoldStatus
+from .. import schemas
+from ..dependencies import role_required
+from ..core.limiter import limiter
+from ..core.cache import invalidate
+from ..services.holds import ACTIVE, place_statement, place_failure, cancel_hold, queue_position, notify_ready
+from ..services.notification import dispatch_notification_task
+
+router = APIRouter(
+    prefix="/holds",
+    tags=["Holds"]
+)
+
+
+@router.post("/{book_id}", response_model=schemas.HoldOut)
+@limiter.limit("5/minute")
+async def place_hold(
+    request: Request,
+    book_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(role_required(Role.Member))):
+    
+    result = await db.execute(place_statement(current_user.id, book_id))
+    hold = result.scalars().first()
+    
+    if hold is None:
+        raise await place_failure(db, current_user.id, book_id)
+    
+    await db.commit()
+    
+    position = await db.scalar(select(queue_position(Hold)).where(Hold.id == hold.id))
+    return schemas.HoldOut(
+        id=hold.id, book_id=hold.book_id, status=hold.status, created_at=hold.created_at,
+        position=position
+    )
+
+@router.get("/me", response_model=List[schemas.HoldOut])
+async def get_my_holds(
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(role_required(Role.Member))):
+    
+    result = await db.execute(
+        select(Hold, queue_position(Hold))
+        .where(Hold.user_id == current_user.id, Hold.status.in_(ACTIVE))
+        .order_by(Hold.created_at)
+    )
+    
+    return [
+        schemas.HoldOut(
+            id=hold.id, book_id=hold.book_id, status=hold.status, created_at=hold.created_at,
+            ready_at=hold.ready_at, expires_at=hold.expires_at,
+            position=position if hold.status == HoldStatus.Waiting else None
+        )
+        for hold, position in result.all()
+    ]
+
+@router.delete("/{book_id}")
+async def cancel_my_hold(
+    book_id: int,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(role_required(Role.Member))):
+    
+    was_ready, promotions = await cancel_hold(db, current_user.id, book_id)
+    
+    if was_ready:
+        await invalidate(f"book:{book_id}")
+    for args in await notify_ready(db, promotions):
+        background_tasks.add_task(dispatch_notification_task, *args)
+    
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
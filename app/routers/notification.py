@@ -1,10 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
-from fastapi_cache.decorator import cache
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
-from sqlalchemy import or_, func, update
-from typing import List, Optional
+from sqlalchemy import Integer, any_, exists, literal, or_, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from typing import List, Optional, Union
 from datetime import datetime, timezone
 
 from app.database import get_db, get_session
@@ -12,7 +12,12 @@ from app.models import Book, User, Role, BorrowRecord, Notification
 from .. import schemas
 from ..dependencies import role_required, get_current_user
 from ..services.scheduler import scan_due_and_overdue_once
+from ..services.search import contains
+from ..services.export import export_response
+from ..services.unread import note_unread, unread_count
 from ..core.limiter import limiter
+from ..core.cache import cached, conditional, bump_versions
+from ..pagination import encode_cursor, decode_cursor, keyset_after, keyset_order
 
 
 router = APIRouter(
@@ -20,22 +25,49 @@ router = APIRouter(
     tags=["Notifications"]
 )
 
-@router.get("/", response_model=List[schemas.NotificationOut])
+def inbox_scope(params, user):
+    return [f"notifications:{user.id}"]
+
+INBOX_FIELDS = (
+    Notification.id, Notification.message, Notification.type,
+    Notification.is_read, Notification.created_at,
+)
+INBOX_KEYSET = (Notification.created_at, Notification.id)
+
+@router.get("/", response_model=Union[List[schemas.NotificationOut], schemas.NotificationPage])
+@conditional(inbox_scope)
 async def list_my_notifications(
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
     unread: Optional[bool] = Query(None),
     skip: int = 0,
-    limit: int = 50):
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="Keyset paging: pass an empty value for the first page, then each page's next_cursor")):
     
-    stmt = select(Notification).where(Notification.user_id == current_user.id)
+    stmt = select(*INBOX_FIELDS).where(Notification.user_id == current_user.id)
     
     if unread is not None:
-        stmt = stmt.where(Notification.is_read == unread)
+        stmt = stmt.where(Notification.is_read == (not unread))
+    
+    if cursor is None:
+        stmt = stmt.order_by(*keyset_order(INBOX_KEYSET, descending=True)).offset(skip).limit(limit)
+        result = await db.execute(stmt)
+        return result.all()
+    
+    if cursor:
+        after = decode_cursor(cursor, "notifications", (datetime.fromisoformat, int))
+        stmt = stmt.where(keyset_after(INBOX_KEYSET, after, descending=True))
     
-    stmt = stmt.order_by(Notification.created_at.desc()).offset(skip).limit(limit)
-    result = await db.execute(stmt)    
-    return result.scalars().all()
+    stmt = stmt.order_by(*keyset_order(INBOX_KEYSET, descending=True)).limit(limit + 1)
+    result = await db.execute(stmt)
+    items = result.all()
+    
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor("notifications", [items[-1].created_at, items[-1].id])
+    
+    return schemas.NotificationPage(items=items, next_cursor=next_cursor)
 
 @router.patch("/{id}/read", status_code=status.HTTP_204_NO_CONTENT)
 async def mark_notification_as_read(
@@ -43,25 +75,64 @@ async def mark_notification_as_read(
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)):
     
-    result = await db.execute(
-        select(Notification).where(
-            Notification.id == id,
-            Notification.user_id == current_user.id
-            )
-        )
-    notify = result.scalars().first()
+    owned = (Notification.id == id) & (Notification.user_id == current_user.id)
+    marked = await db.scalar(
+        update(Notification)
+        .where(owned, Notification.is_read == False)
+        .values(is_read=True)
+        .returning(Notification.id)
+    )
     
-    if not notify:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                            detail="Notificaton not found")
+    if marked is None:
+        if not await db.scalar(select(exists().where(owned))):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                detail="Notificaton not found")
+        return None
     
-    notify.is_read = True
+    note_unread(db, current_user.id, -1)
     await db.commit()
-    await db.refresh(notify)
+    await bump_versions(f"notifications:{current_user.id}")
     return None
 
+MAX_ACK_RANGE = 500
+
+@router.patch("/read", response_model=schemas.NotificationAckResult)
+async def acknowledge_notifications(
+    ack: schemas.NotificationAck,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)):
+    
+    if ack.ids is not None and ack.from_id is None and ack.to_id is None:
+        selected = Notification.id == any_(literal(ack.ids, ARRAY(Integer)))
+    elif ack.ids is None and ack.from_id is not None and ack.to_id is not None:
+        if not 0 <= ack.to_id - ack.from_id < MAX_ACK_RANGE:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f"to_id must be at least from_id and cover at most {MAX_ACK_RANGE} ids")
+        selected = Notification.id.between(ack.from_id, ack.to_id)
+    else:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Pass either ids or both from_id and to_id")
+    
+    result = await db.execute(
+        update(Notification)
+        .where(Notification.user_id == current_user.id, Notification.is_read == False, selected)
+        .values(is_read=True)
+        .returning(Notification.id)
+        .execution_options(synchronize_session=False)
+    )
+    updated = sorted(result.scalars())
+    
+    note_unread(db, current_user.id, -len(updated))
+    await db.commit()
+    if updated:
+        await bump_versions(f"notifications:{current_user.id}")
+    return schemas.NotificationAckResult(updated=updated)
+
+def overdue_tags(params, data):
+    return ["borrows:active", *(f"book:{item['book']['id']}" for item in data)]
+
 @router.get("/overdue", response_model=List[schemas.OverdueBorrowOut])
-@cache(expire=10)
+@cached(namespace="borrows", expire=10, model=List[schemas.OverdueBorrowOut], tags=overdue_tags)
 async def list_overdue(
     db: AsyncSession = Depends(get_db),
     _: User = Depends(role_required(Role.Librarian)),
@@ -85,9 +156,9 @@ async def list_overdue(
             stmt.join(BorrowRecord.user).join(BorrowRecord.book)
             .where(
                 or_(
-                    User.name.ilike(f"%{search}%"),
-                    User.email.ilike(f"%{search}%"),
-                    Book.title.ilike(f"%{search}%")                    
+                    contains(User.name, search),
+                    contains(User.email, search),
+                    contains(Book.title, search)
                 )
             )
         )
@@ -106,17 +177,12 @@ async def manual_scan(
     return {"detail": "Manual scan completed"}
 
 @router.get("/unread-count", response_model=schemas.UnreadCount)
+@conditional(inbox_scope)
 async def get_unread_count(
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)):
     
-    query = select(func.count(Notification.id)).where(
-        Notification.user_id == current_user.id,
-        Notification.is_read == False,
-    )
-    
-    unread_count = await db.scalar(query)
-    return {"unread": unread_count or 0}
+    return {"unread": await unread_count(db, current_user.id)}
 
 @router.patch("/read-all", status_code=status.HTTP_204_NO_CONTENT)
 async def mark_all_as_read(
@@ -128,10 +194,31 @@ async def mark_all_as_read(
     if before:
         clause = clause & (Notification.created_at <= before)
     
-    await db.execute(
+    result = await db.execute(
         update(Notification)
         .where(clause)
         .values(is_read=True)
     )
+    note_unread(db, current_user.id, -result.rowcount)
     await db.commit()
-    return None
\ No newline at end of file
+    await bump_versions(f"notifications:{current_user.id}")
+    return None
+
+@router.get("/export")
+async def export_notifications(
+    _: User = Depends(role_required(Role.Librarian)),
+    format: schemas.ExportFormat = Query(schemas.ExportFormat.ndjson),
+    unread: Optional[bool] = Query(None),
+    user_id: Optional[int] = Query(None)):
+    
+    stmt = select(
+        Notification.id, Notification.user_id, Notification.type,
+        Notification.message, Notification.is_read, Notification.created_at
+    ).order_by(Notification.id)
+    
+    if unread is not None:
+        stmt = stmt.where(Notification.is_read == (not unread))
+    if user_id is not None:
+        stmt = stmt.where(Notification.user_id == user_id)
+    
+    return export_response(stmt, format, "notifications")
\ No newline at end of file
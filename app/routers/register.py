@@ -1,15 +1,16 @@
 from __future__ import annotations
 from fastapi import APIRouter, Depends, HTTPException, Request
-from fastapi_cache import FastAPICache
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update
 
 from ..database import get_db
 from ..models import User, Role
 from ..schemas import UserRegister, UserOut, UserPreferencesUpdate
-from ..utils import hash_password
+from ..core.hashing import hash_password_async
 from ..dependencies import get_current_user
 from ..core.limiter import limiter
+from ..core.cache import invalidate
+from ..services.suggest import publish_suggestions, AUTHOR
 
 router = APIRouter(
     tags=["Authentication"]
@@ -34,7 +35,7 @@ async def register_user(
     user = User(
         name=payload.name,
         email=payload.email,
-        password=hash_password(payload.password),
+        password=await hash_password_async(payload.password),
         role=payload.role,
         bio=payload.bio,
         birthdate=payload.birthdate
@@ -44,7 +45,9 @@ async def register_user(
     await db.commit()
     await db.refresh(user)
     
-    await FastAPICache.clear(namespace="users")
+    await invalidate(f"users:role:{user.role.value}")
+    if user.role == Role.Author:
+        await publish_suggestions(add=[(AUTHOR, user.id, user.name)])
     
     return user
 
@@ -54,8 +57,15 @@ async def update_my_preference(
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)):
     
-    current_user.notification_preference = preferences.notification_preference
-    db.add(current_user)
+    # current_user may be a cached, detached principal; write with UPDATE.
+    result = await db.execute(
+        update(User)
+        .where(User.id == current_user.id)
+        .values(notification_preference=preferences.notification_preference)
+        .returning(User)
+    )
+    user = result.scalar_one()
     await db.commit()
-    await db.refresh(current_user)
-    return current_user
\ No newline at end of file
+    
+    await invalidate(f"user:{current_user.id}")
+    return user
\ No newline at end of file
@@ -1,22 +1,29 @@
 from fastapi import APIRouter, Depends, Query
-from fastapi_cache.decorator import cache
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import or_
 from typing import List, Optional
 
 from app.database import get_db
 from app.models import User, Role
 from .. import schemas
 from ..dependencies import role_required
+from ..core.cache import cached
+from ..services.search import user_search_clause, user_rank
 
 router = APIRouter(
     prefix="/users",
     tags=["Authors"]
 )
 
+
+def user_list_tags(role: Role):
+    def tags(params, data):
+        return [f"users:role:{role.value}", *(f"user:{item['id']}" for item in data)]
+    return tags
+
 @router.get("/authors", response_model=List[schemas.UserOut])
-@cache(expire=60, namespace="users")
+@cached(namespace="users", expire=60, model=List[schemas.UserOut], tags=user_list_tags(Role.Author),
+        stale_while_revalidate=60)
 async def get_authors(
     db: AsyncSession = Depends(get_db),
     _: User = Depends(role_required(Role.Librarian)),
@@ -27,12 +34,7 @@ async def get_authors(
     query = select(User).where(User.role == Role.Author)
     
     if search:
-        query = query.where(
-            or_(
-                User.name.ilike(f"%{search}%"),
-                User.email.ilike(f"%{search}%")
-            )
-        )
+        query = query.where(user_search_clause(search)).order_by(user_rank(search).desc(), User.id)
     
     result = await db.execute(query.offset(skip).limit(limit))
     authors = result.scalars().all()    
@@ -40,7 +42,8 @@ async def get_authors(
 
 
 @router.get("/members", response_model=List[schemas.UserOut])
-@cache(expire=60, namespace="users")
+@cached(namespace="users", expire=60, model=List[schemas.UserOut], tags=user_list_tags(Role.Member),
+        stale_while_revalidate=60)
 async def get_members(
     db: AsyncSession = Depends(get_db),
     _: User = Depends(role_required(Role.Librarian)),
@@ -50,12 +53,7 @@ async def get_members(
     query = select(User).where(User.role == Role.Member)
     
     if search:
-        query = query.where(
-            or_(
-                User.name.ilike(f"%{search}%"),
-                User.email.ilike(f"%{search}%")
-            )
-        )
+        query = query.where(user_search_clause(search)).order_by(user_rank(search).desc(), User.id)
     
     result = await db.execute(query.offset(skip).limit(limit))
     members = result.scalars().all()
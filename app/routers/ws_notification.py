@@ -2,8 +2,11 @@ from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query, status, HT
 from jose import jwt, JWTError
 from typing import Optional
 
+from app.database import get_session
 from app.realtime.manager import ws_manager
+from app.services.unread import unread_count, unread_payload
 from ..oauth2 import SECRET_KEY, ALGORITHM
+from ..core.revocation import revocations
 
 router = APIRouter(
     prefix="/ws",
@@ -22,7 +25,10 @@ def get_user_id_from_token(token: str) -> Optional[int]:
         user_id = payload.get("sub")
         if user_id is None:
             return None
-        return int(user_id)
+        user_id = int(user_id)
+        if revocations.is_revoked(user_id, int(payload.get("ver", 0)), payload.get("jti")):
+            return None
+        return user_id
     except (JWTError, ValueError, TypeError):
         return None
 
@@ -32,6 +38,12 @@ async def ws_notifications(
     token: str = Query(..., description="JWT Access Token")
     ):
     
+    if not revocations.loaded.is_set():
+        # Revoked tokens are not known yet, so none can be trusted.
+        await websocket.accept()
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason="Try again shortly")
+        return
+    
     user_id = get_user_id_from_token(token)
     
     if user_id is None:
@@ -43,6 +55,8 @@ async def ws_notifications(
     
     try:
         await websocket.send_json({"type": "status", "data": "Connection successful"})
+        async with get_session() as db:
+            await websocket.send_json(unread_payload(await unread_count(db, user_id)))
         while True:
             await websocket.receive_text()
     except WebSocketDisconnect:
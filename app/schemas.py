@@ -1,8 +1,9 @@
 from __future__ import annotations
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime, date
-from .models import BookStatus, NotificationPreference
+import enum
+from .models import BookStatus, NotificationPreference, HoldStatus
 
 from .models import Role
 
@@ -40,6 +41,9 @@ class TokenPayload(BaseModel):
     sub: int
     role: Role
     exp: int
+    # Absent from tokens issued before revocation support.
+    ver: int = 0
+    jti: Optional[str] = None
 
 class BookBase(BaseModel):
     isbn: Optional[str] = None
@@ -49,7 +53,7 @@ class BookBase(BaseModel):
     status: Optional[BookStatus] = None
 
 class BookUpload(BookBase):
-    pass
+    total_copies: int = Field(1, ge=1)
 
 class BookUpdate(BaseModel):
     isbn: Optional[str] = None
@@ -57,6 +61,7 @@ class BookUpdate(BaseModel):
     description: Optional[str] = None
     published_date: Optional[date] = None
     status: Optional[BookStatus] = None
+    total_copies: Optional[int] = Field(None, ge=1)
 
 
 class BookOut(BookBase):
@@ -64,11 +69,46 @@ class BookOut(BookBase):
     author_name: str
     status: BookStatus
     created_at: datetime
+    total_copies: int
+    available_count: int
     
     class Config:
         from_attributes = True
 
 
+class BookSort(str, enum.Enum):
+    created = "created"
+    title = "title"
+
+
+class BookPage(BaseModel):
+    items: List[BookOut]
+    next_cursor: Optional[str] = None
+
+
+class BookImportError(BaseModel):
+    row: int
+    isbn: Optional[str] = None
+    detail: str
+
+
+class BookImportResult(BaseModel):
+    inserted: int
+    failed: int
+    errors: List[BookImportError]
+
+
+class ExportFormat(str, enum.Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+class Suggestion(BaseModel):
+    kind: str
+    id: int
+    label: str
+
+
 class BorrowBook(BaseModel):
     id: int
     book_id: int
@@ -88,6 +128,49 @@ class BorrowInfo(BorrowBook):
         from_attributes = True
 
 
+class LoanSummary(BaseModel):
+    open: int
+    due_today: int
+    overdue: int
+
+
+class ActiveBorrowPage(BaseModel):
+    items: List[BorrowInfo]
+    next_cursor: Optional[str] = None
+    summary: LoanSummary
+
+
+class BorrowBatch(BaseModel):
+    book_ids: List[int] = Field(..., min_length=1, max_length=50)
+    all_or_nothing: bool = Field(False, description="Apply nothing if any item fails")
+
+
+class BorrowBatchItem(BaseModel):
+    book_id: int
+    ok: bool
+    detail: Optional[str] = None
+    borrow: Optional[BorrowBook] = None
+
+
+class BorrowBatchResult(BaseModel):
+    succeeded: int
+    failed: int
+    items: List[BorrowBatchItem]
+
+
+class HoldOut(BaseModel):
+    id: int
+    book_id: int
+    status: HoldStatus
+    created_at: datetime
+    ready_at: Optional[datetime] = None
+    expires_at: Optional[datetime] = None
+    position: Optional[int] = Field(None, description="Place in the queue while Waiting")
+    
+    class Config:
+        from_attributes = True
+
+
 class AuthorInfo(UserOut):
     book: BookOut    
     class Config:
@@ -105,6 +188,21 @@ class NotificationOut(BaseModel):
         from_attributes = True
 
 
+class NotificationPage(BaseModel):
+    items: List[NotificationOut]
+    next_cursor: Optional[str] = None
+
+
+class NotificationAck(BaseModel):
+    ids: Optional[List[int]] = Field(None, min_length=1, max_length=500)
+    from_id: Optional[int] = Field(None, description="With to_id: every notification in this id range, inclusive")
+    to_id: Optional[int] = None
+
+
+class NotificationAckResult(BaseModel):
+    updated: List[int]
+
+
 class UnreadCount(BaseModel):
     unread: int
 
@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, insert, select
+
+from app.config import settings
+from app.database import get_session
+from app.models import BorrowRecord, BorrowRecordArchive
+
+ARCHIVED_COLUMNS = [c.name for c in BorrowRecordArchive.__table__.c]
+
+
+def archive_batch(cutoff: datetime, batch_size: int):
+    """One statement moving up to ``batch_size`` loans returned before
+    ``cutoff`` from borrow_records into borrow_records_archive.
+
+    Rows locked by a concurrent transaction are skipped and picked up by a
+    later run.
+    """
+    batch = (
+        select(BorrowRecord.id)
+        .where(BorrowRecord.returned_at < cutoff)
+        .order_by(BorrowRecord.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    moved = (
+        delete(BorrowRecord)
+        .where(BorrowRecord.id.in_(batch))
+        .returning(*(BorrowRecord.__table__.c[name] for name in ARCHIVED_COLUMNS))
+        .cte("moved")
+    )
+    return (
+        insert(BorrowRecordArchive)
+        .from_select(ARCHIVED_COLUMNS, select(*(moved.c[name] for name in ARCHIVED_COLUMNS)))
+        .add_cte(moved)
+    )
+
+
+async def archive_returned_loans_once() -> int:
+    """Move every loan returned more than ``borrow_archive_after_days`` ago,
+    one committed batch at a time so locks and WAL stay bounded."""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=settings.borrow_archive_after_days)
+    batch_size = settings.borrow_archive_batch_size
+    total = 0
+    async with get_session() as db:
+        while True:
+            result = await db.execute(archive_batch(cutoff, batch_size))
+            await db.commit()
+            total += result.rowcount
+            if result.rowcount < batch_size:
+                break
+    print(f"[archive] Archived {total} returned loans.")
+    return total
@@ -0,0 +1,196 @@
+import csv
+import json
+from datetime import date
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Book, BookStatus
+from app.schemas import BookUpload, BookImportError, BookImportResult
+from app.services.suggest import publish_suggestions, BOOK
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+# Longest line, and longest CSV record across lines, that is buffered; longer
+# ones are skipped and reported as row errors.
+MAX_LINE_BYTES = 64 * 1024
+MAX_RECORD_CHARS = 256 * 1024
+
+CSV = "csv"
+NDJSON = "ndjson"
+
+_MAX_LENGTHS = {
+    name: Book.__table__.c[name].type.length
+    for name in ("isbn", "title")
+}
+
+
+LINE_TOO_LONG = ValueError(f"Line longer than {MAX_LINE_BYTES} bytes")
+
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Any]:
+    """Lines of the stream; an over-long line is yielded as ``LINE_TOO_LONG``
+    instead and the rest of it is skipped."""
+    buffer = b""
+    skipping = False
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if skipping:
+                skipping = False
+                continue
+            yield line if len(line) <= MAX_LINE_BYTES else LINE_TOO_LONG
+        if len(buffer) > MAX_LINE_BYTES:
+            if not skipping:
+                yield LINE_TOO_LONG
+            skipping = True
+            buffer = b""
+    if buffer and not skipping:
+        yield buffer
+
+
+async def _csv_records(lines: AsyncIterator[Any]) -> AsyncIterator[Tuple[int, Any]]:
+    header: Optional[List[str]] = None
+    pending = ""
+    row = 0
+    async for raw in lines:
+        if isinstance(raw, Exception):
+            pending = ""
+            row += 1
+            yield row, raw
+            continue
+        pending += raw.decode("utf-8", errors="replace")
+        # A quoted field may span lines; wait for the closing quote.
+        if pending.count('"') % 2:
+            if len(pending) > MAX_RECORD_CHARS:
+                # Everything after an unclosed quote belongs to it, so no
+                # later row can be parsed reliably.
+                yield row + 1, ValueError(f"Unterminated quoted field (record longer than {MAX_RECORD_CHARS} characters)")
+                return
+            pending += "\n"
+            continue
+        record, pending = pending.rstrip("\r"), ""
+        if not record.strip():
+            continue
+        values = next(csv.reader([record]))
+        if header is None:
+            header = [h.strip() for h in values]
+            continue
+        row += 1
+        yield row, {k: (v if v != "" else None) for k, v in zip(header, values)}
+    if pending.strip():
+        yield row + 1, ValueError("Unterminated quoted field")
+
+
+async def _ndjson_records(lines: AsyncIterator[Any]) -> AsyncIterator[Tuple[int, Any]]:
+    row = 0
+    async for raw in lines:
+        if isinstance(raw, Exception):
+            row += 1
+            yield row, raw
+            continue
+        if not raw.strip():
+            continue
+        row += 1
+        try:
+            record = json.loads(raw)
+        except ValueError as e:
+            record = ValueError(f"Invalid JSON: {e}")
+        yield row, record
+
+
+class CatalogImport:
+    """Validates streamed catalog rows and writes them in multi-row INSERTs.
+
+    Only one batch of rows is held in memory at a time, and at most
+    ``MAX_REPORTED_ERRORS`` row errors are kept for the report.
+    """
+
+    def __init__(self, db: AsyncSession, author_id: int):
+        self.db = db
+        self.author_id = author_id
+        self.inserted = 0
+        self.failed = 0
+        self.errors: List[BookImportError] = []
+        self._batch: List[Tuple[int, Dict[str, Any]]] = []
+
+    def _error(self, row: int, detail: str, isbn: Optional[str] = None) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(BookImportError(row=row, isbn=isbn, detail=detail))
+
+    async def run(self, chunks: AsyncIterator[bytes], format: str) -> BookImportResult:
+        parse = _csv_records if format == CSV else _ndjson_records
+        async for row, record in parse(_lines(chunks)):
+            if isinstance(record, Exception):
+                self._error(row, str(record))
+                continue
+            self._add(row, record)
+            if len(self._batch) >= BATCH_SIZE:
+                await self._flush()
+        await self._flush()
+
+        return BookImportResult(inserted=self.inserted, failed=self.failed, errors=self.errors)
+
+    def _add(self, row: int, record: Any) -> None:
+        try:
+            book = BookUpload.model_validate(record)
+        except ValidationError as e:
+            self._error(row, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+            return
+
+        for field, max_length in _MAX_LENGTHS.items():
+            value = getattr(book, field)
+            if value is not None and len(value) > max_length:
+                self._error(row, f"{field}: longer than {max_length} characters", book.isbn)
+                return
+
+        self._batch.append((row, {
+            "isbn": book.isbn,
+            "title": book.title,
+            "description": book.description,
+            "published_date": book.published_date or date.today(),
+            "status": book.status or BookStatus.Available,
+            "total_copies": book.total_copies,
+            "available_count": book.total_copies,
+            "author_id": self.author_id,
+        }))
+
+    async def _flush(self) -> None:
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+
+        values = []
+        seen = set()
+        for row, book in batch:
+            if book["isbn"] is not None:
+                if book["isbn"] in seen:
+                    self._error(row, "Duplicate ISBN in import", book["isbn"])
+                    continue
+                seen.add(book["isbn"])
+            values.append((row, book))
+        if not values:
+            return
+
+        stmt = (
+            insert(Book)
+            .values([book for _, book in values])
+            .on_conflict_do_nothing(index_elements=[Book.isbn])
+            .returning(Book.id, Book.title, Book.isbn)
+        )
+        result = await self.db.execute(stmt)
+        created = result.all()
+        await self.db.commit()
+
+        inserted_isbns = {isbn for _, _, isbn in created if isbn is not None}
+        for row, book in values:
+            if book["isbn"] is not None and book["isbn"] not in inserted_isbns:
+                self._error(row, "ISBN already exists", book["isbn"])
+
+        if created:
+            await publish_suggestions(add=[(BOOK, id, title) for id, title, _ in created])
+        self.inserted += len(created)
@@ -0,0 +1,330 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import DateTime, Integer, and_, any_, exists, func, literal, or_, select, true, union_all, update
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.models import Book, BorrowRecord, BorrowRecordArchive, Hold, HoldStatus, User
+from app.pagination import keyset_after, keyset_order
+from app.schemas import BorrowBatchItem, BorrowBatchResult
+from app.services.holds import Promotion, promote
+from app.services.inventory import claim_copy, release_copy
+
+# Borrow and return each run as a single statement: data-modifying CTEs claim
+# or release the copy, open or close the loan, and the outer SELECT projects
+# the response (including the author name) from what the CTEs returned. An
+# empty result means nothing applied; the caller rolls back and asks
+# :func:`borrow_failure` why.
+
+LOAN_PERIOD = timedelta(days=14)
+
+BOOK_FIELDS = (
+    "id", "isbn", "title", "description", "published_date", "status",
+    "created_at", "total_copies", "available_count", "author_id",
+)
+LOAN_FIELDS = ("id", "book_id", "borrowed_at", "due_at", "returned_at")
+
+_BOOK_RETURNING = [Book.__table__.c[name] for name in BOOK_FIELDS]
+_LOAN_RETURNING = [BorrowRecord.__table__.c[name] for name in LOAN_FIELDS]
+
+
+def loan_projection(loans, books):
+    """SELECT of loan columns joined to their book and its author's name,
+    in the shape :func:`loan_out` expects."""
+    return (
+        select(
+            *(loans.c[name] for name in LOAN_FIELDS),
+            *(books.c[name].label(f"book__{name}") for name in BOOK_FIELDS),
+            User.name.label("author_name"),
+        )
+        .select_from(loans)
+        .join(books, books.c.id == loans.c.book_id)
+        .join(User, User.id == books.c.author_id)
+    )
+
+
+def borrow_statement(user_id: int, book_id, due_at: datetime):
+    """Claim a copy of ``book_id`` and open a loan for ``user_id``.
+
+    ``book_id`` is an id or an expression such as ``any_(...)`` matching
+    several books, one result row per loan opened.
+
+    The open-loan unique index turns a second borrow of the same title into a
+    no-op (and so an empty result) instead of a duplicate row. The member's
+    hold on the title is fulfilled; if it was Ready, the copy set aside for
+    it is the one taken.
+    """
+    fulfilled = (
+        update(Hold)
+        .where(
+            Hold.user_id == user_id,
+            Hold.book_id == book_id,
+            or_(
+                Hold.status == HoldStatus.Waiting,
+                and_(Hold.status == HoldStatus.Ready, Hold.expires_at > func.now()),
+            ),
+        )
+        .values(status=HoldStatus.Fulfilled)
+        .returning(Hold.book_id, Hold.ready_at)
+        .cte("fulfilled")
+    )
+    reserved = select(fulfilled.c.book_id).where(fulfilled.c.ready_at.is_not(None))
+    claimed = claim_copy(book_id, *_BOOK_RETURNING, reserved=reserved).cte("claimed")
+    opened = (
+        insert(BorrowRecord)
+        .from_select(
+            ["user_id", "book_id", "due_at"],
+            select(literal(user_id), claimed.c.id, literal(due_at, DateTime(timezone=True))),
+        )
+        .on_conflict_do_nothing(
+            index_elements=[BorrowRecord.user_id, BorrowRecord.book_id],
+            index_where=BorrowRecord.returned_at.is_(None),
+        )
+        .returning(*_LOAN_RETURNING)
+        .cte("opened")
+    )
+    return loan_projection(opened, claimed)
+
+
+def return_statement(user_id: int, book_id, returned_at: datetime):
+    """Close ``user_id``'s open loan of ``book_id`` and put the copy back, or
+    hand it to the next hold on the title.
+
+    Rows carry ``hold_user_id`` and ``hold_expires_at`` when a hold was
+    promoted.
+    """
+    closed = (
+        update(BorrowRecord)
+        .where(
+            BorrowRecord.user_id == user_id,
+            BorrowRecord.book_id == book_id,
+            BorrowRecord.returned_at.is_(None),
+        )
+        .values(returned_at=returned_at)
+        .returning(*_LOAN_RETURNING)
+        .cte("closed")
+    )
+    promoted = promote(closed).cte("promoted")
+    released = release_copy(
+        select(closed.c.book_id), *_BOOK_RETURNING, reserved=select(promoted.c.book_id)
+    ).cte("released")
+    return (
+        loan_projection(closed, released)
+        .add_columns(promoted.c.user_id.label("hold_user_id"), promoted.c.expires_at.label("hold_expires_at"))
+        .outerjoin(promoted, promoted.c.book_id == closed.c.book_id)
+    )
+
+
+def borrow_history(user_id: Optional[int] = None):
+    """Open and returned loans across borrow_records and its archive, as one
+    subquery with the ``LOAN_FIELDS`` plus ``user_id``."""
+    branches = []
+    for table in (BorrowRecord.__table__, BorrowRecordArchive.__table__):
+        branch = select(*(table.c[name] for name in LOAN_FIELDS), table.c.user_id)
+        if user_id is not None:
+            branch = branch.where(table.c.user_id == user_id)
+        branches.append(branch)
+    return union_all(*branches).subquery("borrow_history")
+
+
+def active_loans_statement(criteria: List[Any], after: Optional[List[Any]], limit: int, now: datetime):
+    """One page of open loans matching ``criteria`` plus a summary of all of
+    them, in a single statement.
+
+    Rows are ``summary LEFT JOIN page``, so the summary columns (``open``,
+    ``due_today``, ``overdue``) arrive even when the page is empty, in which
+    case the loan columns are NULL. Pages are keyed on (borrowed_at, id),
+    newest first, and hold up to ``limit`` rows.
+    """
+    criteria = [BorrowRecord.returned_at.is_(None), *criteria]
+    end_of_today = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), timezone.utc)
+
+    summary = (
+        select(
+            func.count().label("open"),
+            func.count().filter(BorrowRecord.due_at >= now, BorrowRecord.due_at < end_of_today).label("due_today"),
+            func.count().filter(BorrowRecord.due_at < now).label("overdue"),
+        )
+        .where(*criteria)
+        .subquery("summary")
+    )
+
+    keyset = (BorrowRecord.borrowed_at, BorrowRecord.id)
+    loans = select(*_LOAN_RETURNING, BorrowRecord.user_id).where(*criteria)
+    if after is not None:
+        loans = loans.where(keyset_after(keyset, after, descending=True))
+    loans = loans.order_by(*keyset_order(keyset, descending=True)).limit(limit).subquery("loans")
+
+    borrower = aliased(User)
+    page = (
+        loan_projection(loans, Book.__table__)
+        .add_columns(borrower.name.label("user__name"), borrower.email.label("user__email"))
+        .join(borrower, borrower.id == loans.c.user_id)
+        .subquery("page")
+    )
+    return (
+        select(summary, page)
+        .select_from(summary.outerjoin(page, true()))
+        .order_by(*keyset_order((page.c.borrowed_at, page.c.id), descending=True))
+    )
+
+
+def loan_out(row) -> Dict[str, Any]:
+    """Shape a projection row like ``schemas.BorrowBook``."""
+    values = row._mapping
+    book = {name: values[f"book__{name}"] for name in BOOK_FIELDS}
+    book["author_name"] = values["author_name"]
+    return {**{name: values[name] for name in LOAN_FIELDS}, "book": book}
+
+
+async def borrow_failure(db: AsyncSession, user_id: int, book_id: int) -> HTTPException:
+    """Why a borrow statement came back empty."""
+    already = (
+        exists()
+        .where(
+            BorrowRecord.user_id == user_id,
+            BorrowRecord.book_id == book_id,
+            BorrowRecord.returned_at.is_(None),
+        )
+    )
+    row = (await db.execute(select(Book.id, already).where(Book.id == book_id))).first()
+
+    if row is None:
+        return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
+    if row[1]:
+        return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="You have already borrowed this book")
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Book already borrowed")
+
+
+def due_date() -> datetime:
+    return datetime.now(timezone.utc) + LOAN_PERIOD
+
+
+# Batches lock every row they touch in one ordered SELECT ... FOR UPDATE,
+# validate in Python, then apply the valid items with the same single
+# statements as above, matching ``id = ANY(...)``. Locking in id order keeps
+# concurrent batches from deadlocking each other.
+#
+# The locks do not cover the open-loan index, so a concurrent borrow of the
+# same title can still slip in between the check and the statement; its item
+# then comes back without a row. The statement runs under a savepoint, so
+# such a partial result is rolled back (keeping the locks) and the rest is
+# applied again without it, or not at all for ``all_or_nothing``.
+
+NOT_APPLIED = "Not applied: another item in the batch failed"
+
+
+def _any(ids: List[int]):
+    return any_(literal(ids, ARRAY(Integer)))
+
+
+async def _apply(
+    db: AsyncSession,
+    book_ids: List[int],
+    errors: Dict[int, str],
+    all_or_nothing: bool,
+    statement: Callable[[List[int]], Any],
+    explain: Callable[[int], Awaitable[str]],
+) -> Tuple[BorrowBatchResult, List[Promotion]]:
+    valid = [id for id in book_ids if id not in errors]
+    done: Dict[int, Dict[str, Any]] = {}
+    promotions: List[Promotion] = []
+    while valid and not (errors and all_or_nothing):
+        savepoint = await db.begin_nested()
+        rows = (await db.execute(statement(valid))).all()
+        applied = {row.book_id for row in rows}
+        missed = [id for id in valid if id not in applied]
+        if missed:
+            await savepoint.rollback()
+            for id in missed:
+                errors[id] = await explain(id)
+            valid = [id for id in valid if id in applied]
+            continue
+        await savepoint.commit()
+        for row in rows:
+            done[row.book_id] = loan_out(row)
+            if row._mapping.get("hold_user_id") is not None:
+                promotions.append((row.hold_user_id, row.book__title, row.hold_expires_at))
+        break
+
+    if done:
+        await db.commit()
+    else:
+        await db.rollback()
+
+    items = [
+        BorrowBatchItem(book_id=id, ok=True, borrow=done[id]) if id in done
+        else BorrowBatchItem(book_id=id, ok=False, detail=errors.get(id, NOT_APPLIED))
+        for id in book_ids
+    ]
+    return BorrowBatchResult(succeeded=len(done), failed=len(book_ids) - len(done), items=items), promotions
+
+
+async def checkout_batch(db: AsyncSession, user_id: int, book_ids: List[int], all_or_nothing: bool) -> BorrowBatchResult:
+    book_ids = list(dict.fromkeys(book_ids))
+    already = exists().where(
+        BorrowRecord.user_id == user_id,
+        BorrowRecord.book_id == Book.id,
+        BorrowRecord.returned_at.is_(None),
+    )
+    ready = exists().where(
+        Hold.user_id == user_id,
+        Hold.book_id == Book.id,
+        Hold.status == HoldStatus.Ready,
+        Hold.expires_at > func.now(),
+    )
+    rows = await db.execute(
+        select(Book.id, Book.available_count, already, ready)
+        .where(Book.id == _any(book_ids))
+        .order_by(Book.id)
+        .with_for_update(of=Book)
+    )
+    found = {id: (available, borrowed, held) for id, available, borrowed, held in rows}
+
+    errors = {}
+    for id in book_ids:
+        if id not in found:
+            errors[id] = "Book not found"
+        elif found[id][1]:
+            errors[id] = "You have already borrowed this book"
+        elif found[id][0] <= 0 and not found[id][2]:
+            errors[id] = "Book already borrowed"
+
+    due_at = due_date()
+
+    async def explain(id: int) -> str:
+        return (await borrow_failure(db, user_id, id)).detail
+
+    result, _ = await _apply(db, book_ids, errors, all_or_nothing,
+                             lambda valid: borrow_statement(user_id, _any(valid), due_at), explain)
+    return result
+
+
+async def return_batch(
+    db: AsyncSession, user_id: int, book_ids: List[int], all_or_nothing: bool
+) -> Tuple[BorrowBatchResult, List[Promotion]]:
+    book_ids = list(dict.fromkeys(book_ids))
+    rows = await db.execute(
+        select(BorrowRecord.book_id)
+        .where(
+            BorrowRecord.user_id == user_id,
+            BorrowRecord.book_id == _any(book_ids),
+            BorrowRecord.returned_at.is_(None),
+        )
+        .order_by(BorrowRecord.id)
+        .with_for_update()
+    )
+    open_loans = set(rows.scalars())
+
+    errors = {id: "No active borrow record found" for id in book_ids if id not in open_loans}
+
+    returned_at = datetime.now(timezone.utc)
+
+    async def explain(id: int) -> str:
+        return "No active borrow record found"
+
+    return await _apply(db, book_ids, errors, all_or_nothing,
+                        lambda valid: return_statement(user_id, _any(valid), returned_at), explain)
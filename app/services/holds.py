@@ -0,0 +1,227 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import Integer, column, exists, func, literal, select, text, true, tuple_, update, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.config import settings
+from app.core.cache import invalidate, bump_versions
+from app.database import get_session
+from app.models import Book, BorrowRecord, Hold, HoldStatus, NotificationType
+from app.services.inventory import release_copy, status_after
+from app.services.notification import create_notification_in_db, dispatch_notification_task
+
+# Holds queue members for titles with no copy on the shelf. When a copy comes
+# back it goes to the first Waiting hold instead of the shelf: that hold turns
+# Ready for ``settings.hold_claim_hours`` and available_count is left alone,
+# so only its owner can borrow the copy. Promotion is one probe of the
+# partial (book_id, created_at, id) index, locked with SKIP LOCKED so
+# concurrent returns of the same title promote different holds. Copies added
+# to a title are handed out the same way before any reach the shelf.
+
+ACTIVE = (HoldStatus.Waiting, HoldStatus.Ready)
+
+# (user id, book title, claim expiry) of a promoted hold
+Promotion = Tuple[int, str, datetime]
+
+
+def claim_expiry() -> datetime:
+    return datetime.now(timezone.utc) + timedelta(hours=settings.hold_claim_hours)
+
+
+def promote(books):
+    """UPDATE making the first Waiting hold of each row of ``books`` (any
+    FROM with a ``book_id`` column) Ready."""
+    next_hold = (
+        select(Hold.id)
+        .where(Hold.book_id == books.c.book_id, Hold.status == HoldStatus.Waiting)
+        .order_by(Hold.created_at, Hold.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .lateral("next_hold")
+    )
+    return (
+        update(Hold)
+        .where(Hold.id.in_(select(next_hold.c.id).select_from(books).join(next_hold, true())))
+        .values(status=HoldStatus.Ready, ready_at=func.now(), expires_at=claim_expiry())
+        .returning(Hold.id, Hold.user_id, Hold.book_id, Hold.expires_at)
+    )
+
+
+def fill_statement(book_id: int):
+    """Promote the first Waiting holds on ``book_id``, as many as it has
+    copies on the shelf, and take those copies off the shelf for them.
+
+    Run after adding copies to a title, in the transaction that added them,
+    so a queue is served before walk-in borrowers. Rows are (user_id,
+    title, expires_at) promotions.
+    """
+    on_shelf = select(Book.available_count).where(Book.id == book_id).scalar_subquery()
+    next_holds = (
+        select(Hold.id)
+        .where(Hold.book_id == book_id, Hold.status == HoldStatus.Waiting)
+        .order_by(Hold.created_at, Hold.id)
+        .limit(on_shelf)
+        .with_for_update(skip_locked=True)
+    )
+    promoted = (
+        update(Hold)
+        .where(Hold.id.in_(next_holds))
+        .values(status=HoldStatus.Ready, ready_at=func.now(), expires_at=claim_expiry())
+        .returning(Hold.user_id, Hold.expires_at)
+        .cte("promoted")
+    )
+    left = Book.available_count - select(func.count()).select_from(promoted).scalar_subquery()
+    claimed = (
+        update(Book)
+        .where(Book.id == book_id)
+        .values(available_count=left, status=status_after(left))
+        .returning(Book.title)
+        .cte("claimed")
+    )
+    return select(promoted.c.user_id, claimed.c.title, promoted.c.expires_at).join(claimed, true())
+
+
+def place_statement(user_id: int, book_id: int):
+    """INSERT a Waiting hold, only for an existing title with nothing on the
+    shelf that the member does not already have on loan."""
+    has_loan = exists().where(
+        BorrowRecord.user_id == user_id,
+        BorrowRecord.book_id == Book.id,
+        BorrowRecord.returned_at.is_(None),
+    )
+    return (
+        insert(Hold)
+        .from_select(
+            ["user_id", "book_id"],
+            select(literal(user_id), Book.id).where(Book.id == book_id, Book.available_count <= 0, ~has_loan),
+        )
+        .on_conflict_do_nothing(
+            index_elements=[Hold.user_id, Hold.book_id],
+            # Must repeat uq_holds_active's predicate verbatim for inference.
+            index_where=text("status IN ('Waiting', 'Ready')"),
+        )
+        .returning(Hold)
+    )
+
+
+async def place_failure(db: AsyncSession, user_id: int, book_id: int) -> HTTPException:
+    """Why a place statement inserted nothing."""
+    has_loan = exists().where(
+        BorrowRecord.user_id == user_id,
+        BorrowRecord.book_id == book_id,
+        BorrowRecord.returned_at.is_(None),
+    )
+    row = (await db.execute(select(Book.available_count, has_loan).where(Book.id == book_id))).first()
+
+    if row is None:
+        return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
+    if row[1]:
+        return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="You have already borrowed this book")
+    if row[0] > 0:
+        return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Book is available; borrow it instead")
+    return HTTPException(status_code=status.HTTP_409_CONFLICT, detail="You already have a hold on this book")
+
+
+async def pass_on(db: AsyncSession, book_ids: List[int]) -> List[Promotion]:
+    """Hand one set-aside copy per entry of ``book_ids`` to the next Waiting
+    hold, or back to the shelf when nobody is waiting."""
+    promotions = []
+    for book_id in book_ids:
+        books = values(column("book_id", Integer), name="books").data([(book_id,)])
+        promoted = (await db.execute(promote(books))).first()
+        if promoted is None:
+            await db.execute(release_copy(book_id))
+            continue
+        title = await db.scalar(select(Book.title).where(Book.id == book_id))
+        promotions.append((promoted.user_id, title, promoted.expires_at))
+    return promotions
+
+
+async def cancel_hold(db: AsyncSession, user_id: int, book_id: int) -> Tuple[bool, List[Promotion]]:
+    """Cancel the member's active hold on ``book_id`` and commit.
+
+    A Ready hold passes its copy on; returns whether it was Ready and any
+    promotion that followed.
+    """
+    cancelled = (await db.execute(
+        update(Hold)
+        .where(Hold.user_id == user_id, Hold.book_id == book_id, Hold.status.in_(ACTIVE))
+        .values(status=HoldStatus.Cancelled)
+        .returning(Hold.ready_at)
+    )).first()
+    if cancelled is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No active hold found")
+
+    was_ready = cancelled.ready_at is not None
+    promotions = await pass_on(db, [book_id]) if was_ready else []
+    await db.commit()
+    return was_ready, promotions
+
+
+def queue_position(hold):
+    """Scalar subquery: 1-based place of ``hold`` (a Hold alias or table)
+    among the Waiting holds on its title."""
+    ahead = aliased(Hold)
+    return (
+        select(func.count())
+        .where(
+            ahead.book_id == hold.book_id,
+            ahead.status == HoldStatus.Waiting,
+            tuple_(ahead.created_at, ahead.id) <= tuple_(hold.created_at, hold.id),
+        )
+        .scalar_subquery()
+    )
+
+
+async def notify_ready(db: AsyncSession, promotions: List[Promotion]) -> List[Tuple[Any, ...]]:
+    """Store a notification per promoted hold and commit.
+
+    Returns ``dispatch_notification_task`` argument tuples for the caller to
+    run once the response is out of the way.
+    """
+    if not promotions:
+        return []
+    dispatches = []
+    for user_id, title, expires_at in promotions:
+        message = f"The book '{title}' is ready for you. Borrow it before {expires_at:%Y-%m-%d %H:%M} UTC."
+        notif = await create_notification_in_db(db, user_id, message, NotificationType.System)
+        ws_payload: Dict[str, Any] = {
+            "type": "notification",
+            "data": {
+                "id": notif.id, "message": notif.message,
+                "is_read": notif.is_read,
+                "created_at": notif.created_at.isoformat()
+                }
+            }
+        dispatches.append((user_id, "Your Hold Is Ready", message, ws_payload))
+    await db.commit()
+    await bump_versions(*(f"notifications:{user_id}" for user_id, _, _ in promotions))
+    return dispatches
+
+
+async def expire_hold_claims_once() -> None:
+    """Expire Ready holds nobody borrowed in time and pass their copies on."""
+    async with get_session() as db:
+        result = await db.execute(
+            update(Hold)
+            .where(Hold.status == HoldStatus.Ready, Hold.expires_at <= func.now())
+            .values(status=HoldStatus.Expired)
+            .returning(Hold.book_id)
+        )
+        book_ids = list(result.scalars())
+        if not book_ids:
+            return
+
+        promotions = await pass_on(db, book_ids)
+        await db.commit()
+        await invalidate(*(f"book:{book_id}" for book_id in set(book_ids)))
+        print(f"[holds] Expired {len(book_ids)} claims, promoted {len(promotions)} holds.")
+
+        dispatches = await notify_ready(db, promotions)
+    if dispatches:
+        await asyncio.gather(*(dispatch_notification_task(*args) for args in dispatches))
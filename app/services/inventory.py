@@ -0,0 +1,93 @@
+from sqlalchemy import Select, case, func, literal, or_, update
+
+from app.models import Book, BookStatus
+
+# Copy accounting for multi-copy titles. Every change to available_count is a
+# single conditional UPDATE, so concurrent borrows and returns can never push
+# it outside [0, total_copies] (the table's check constraint backs this up).
+
+
+def _status(value: BookStatus):
+    # Bind through the column type so the enum is stored by name, as the ORM does.
+    return literal(value, Book.status.type)
+
+
+def _matching(book_id):
+    if isinstance(book_id, Select):
+        return Book.id.in_(book_id)
+    return Book.id == book_id
+
+
+def status_after(available):
+    """Status of a title once ``available`` copies remain on the shelf.
+
+    Single-copy titles keep their old Available/Borrowed behaviour; an
+    Overdue mark is left for returns and the scheduler to manage.
+    """
+    return case(
+        (available <= 0, _status(BookStatus.Borrowed)),
+        (Book.status == BookStatus.Borrowed, _status(BookStatus.Available)),
+        else_=Book.status,
+    )
+
+
+def claim_copy(book_id, *returning, reserved=None):
+    """UPDATE taking one copy off the shelf; returns no row if none is left.
+
+    ``book_id`` may be an id, a SQL expression or a SELECT of ids, and ``returning``
+    replaces the default ``RETURNING books.id``. Books in the ``reserved``
+    SELECT already set a copy aside for a hold, so they match even with
+    nothing on the shelf and keep their count.
+    """
+    taken = Book.available_count - 1
+    claimable = Book.available_count > 0
+    if reserved is not None:
+        held = Book.id.in_(reserved)
+        taken = case((held, Book.available_count), else_=taken)
+        claimable = or_(claimable, held)
+    return (
+        update(Book)
+        .where(_matching(book_id), claimable)
+        .values(available_count=taken, status=status_after(taken))
+        .returning(*(returning or (Book.id,)))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def release_copy(book_id, *returning, reserved=None):
+    """UPDATE putting one copy back on the shelf, never beyond ``total_copies``.
+
+    Takes the same arguments as :func:`claim_copy` and always matches the book,
+    so a return is never lost to a drifted counter. Books in ``reserved``
+    handed the copy straight to a hold instead, so their count stays put.
+    """
+    returned = func.least(Book.available_count + 1, Book.total_copies)
+    status = _status(BookStatus.Available)
+    if reserved is not None:
+        held = Book.id.in_(reserved)
+        returned = case((held, Book.available_count), else_=returned)
+        status = case((held, status_after(Book.available_count)), else_=status)
+    return (
+        update(Book)
+        .where(_matching(book_id))
+        .values(available_count=returned, status=status)
+        .returning(*(returning or (Book.id,)))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def resize_inventory(book_id: int, total_copies: int):
+    """UPDATE setting ``total_copies``; returns no row if that would remove
+    copies that are on loan."""
+    delta = total_copies - Book.total_copies
+    return (
+        update(Book)
+        .where(Book.id == book_id, Book.available_count + delta >= 0)
+        .values(
+            total_copies=total_copies,
+            available_count=Book.available_count + delta,
+            status=status_after(Book.available_count + delta),
+        )
+        .returning(Book.id)
+        .execution_options(synchronize_session=False)
+    )
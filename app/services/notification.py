@@ -1,10 +1,12 @@
+from collections import Counter
 from datetime import datetime, timezone
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import insert, select
 from app.models import Notification, User, NotificationPreference,  NotificationType
 from app.realtime.manager import ws_manager
 from .email import send_email_async, email_enabled
-from typing import Optional, Dict, Any
+from .unread import note_unread
+from typing import Optional, Dict, Any, List, Tuple
 
 async def dispatch_notification_task(user_id: int, subject: str, message: str, ws_payload: Dict[str, Any]):
     
@@ -49,8 +51,37 @@ async def create_notification_in_db(
     db.add(notif)
     await db.flush()
     await db.refresh(notif)
+    if user_id is not None:
+        note_unread(db, user_id, 1)
     return notif
 
+async def create_notifications_in_db(
+    db: AsyncSession,
+    notifications: List[Tuple[int, str, NotificationType]],
+    ) -> List[Any]:
+    """Store (user id, message, type) notifications with batched multi-row
+    INSERTs; returns their rows (id, user_id, message, is_read, created_at)
+    in the same order."""
+    
+    if not notifications:
+        return []
+    now = datetime.now(timezone.utc)
+    result = await db.execute(
+        insert(Notification).returning(
+            Notification.id, Notification.user_id, Notification.message,
+            Notification.is_read, Notification.created_at,
+            sort_by_parameter_order=True,
+        ),
+        [
+            {"user_id": user_id, "message": message, "type": type, "is_read": False, "created_at": now}
+            for user_id, message, type in notifications
+        ],
+    )
+    rows = result.all()
+    for user_id, count in Counter(user_id for user_id, _, _ in notifications).items():
+        note_unread(db, user_id, count)
+    return rows
+
 
 '''
 async def create_notification_and_push(
@@ -0,0 +1,120 @@
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Set
+
+from sqlalchemy import delete, func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.core.cache import bump_versions
+from app.database import get_session
+from app.models import Notification
+from app.services.unread import note_unread
+
+# Notifications are pruned in two passes: read ones older than
+# ``notification_retention_days``, then anything beyond the newest
+# ``notification_inbox_cap`` of each inbox. Every DELETE removes at most
+# ``notification_retention_batch_size`` rows picked by a keyset bound, commits,
+# and pauses briefly, so no statement holds locks for long or writes a burst
+# of WAL. Rows locked by a concurrent transaction are skipped until the next
+# run. A setting of 0 turns its pass off.
+
+
+def expired_batch(cutoff: datetime, after_id: int, batch_size: int):
+    """DELETE of up to ``batch_size`` read notifications created before
+    ``cutoff`` with an id above ``after_id``."""
+    batch = (
+        select(Notification.id)
+        .where(Notification.id > after_id, Notification.is_read, Notification.created_at < cutoff)
+        .order_by(Notification.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    return (
+        delete(Notification)
+        .where(Notification.id.in_(batch))
+        .returning(Notification.id, Notification.user_id)
+    )
+
+
+def overflow_batch(user_id: int, boundary, batch_size: int):
+    """DELETE of up to ``batch_size`` of ``user_id``'s notifications at or
+    before the (created_at, id) ``boundary``, oldest first."""
+    keyset = (Notification.created_at, Notification.id)
+    batch = (
+        select(Notification.id)
+        .where(Notification.user_id == user_id, tuple_(*keyset) <= tuple_(*boundary))
+        .order_by(*keyset)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    return (
+        delete(Notification)
+        .where(Notification.id.in_(batch))
+        .returning(Notification.is_read)
+    )
+
+
+async def _pause() -> None:
+    await asyncio.sleep(settings.notification_retention_pause)
+
+
+async def delete_expired(db: AsyncSession, touched: Set[int]) -> int:
+    cutoff = datetime.now(timezone.utc) - timedelta(days=settings.notification_retention_days)
+    batch_size = settings.notification_retention_batch_size
+    after_id, total = 0, 0
+    while True:
+        rows = (await db.execute(expired_batch(cutoff, after_id, batch_size))).all()
+        await db.commit()
+        total += len(rows)
+        touched.update(user_id for _, user_id in rows if user_id is not None)
+        if len(rows) < batch_size:
+            return total
+        after_id = max(id for id, _ in rows)
+        await _pause()
+
+
+async def trim_inboxes(db: AsyncSession, touched: Set[int]) -> int:
+    cap = settings.notification_inbox_cap
+    batch_size = settings.notification_retention_batch_size
+    over_cap = list(await db.scalars(
+        select(Notification.user_id)
+        .where(Notification.user_id.is_not(None))
+        .group_by(Notification.user_id)
+        .having(func.count() > cap)
+    ))
+    total = 0
+    for user_id in over_cap:
+        # The newest row past the cap; it and everything older goes.
+        boundary = (await db.execute(
+            select(Notification.created_at, Notification.id)
+            .where(Notification.user_id == user_id)
+            .order_by(Notification.created_at.desc(), Notification.id.desc())
+            .offset(cap)
+            .limit(1)
+        )).first()
+        if boundary is None:
+            continue
+        while True:
+            read_flags = list(await db.scalars(overflow_batch(user_id, tuple(boundary), batch_size)))
+            note_unread(db, user_id, -Counter(read_flags)[False])
+            await db.commit()
+            total += len(read_flags)
+            if len(read_flags) < batch_size:
+                break
+            await _pause()
+        touched.add(user_id)
+    return total
+
+
+async def prune_notifications_once() -> None:
+    touched: Set[int] = set()
+    expired = trimmed = 0
+    async with get_session() as db:
+        if settings.notification_retention_days > 0:
+            expired = await delete_expired(db, touched)
+        if settings.notification_inbox_cap > 0:
+            trimmed = await trim_inboxes(db, touched)
+    await bump_versions(*(f"notifications:{user_id}" for user_id in touched))
+    print(f"[retention] Deleted {expired} expired and {trimmed} over-cap notifications.")
@@ -1,108 +1,109 @@
 import asyncio
 from datetime import datetime, timedelta, timezone
-from typing import List
-from sqlalchemy import or_, select, update
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy import Integer, any_, literal, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
 
 from app.database import get_session
-from app.models import Book, BookStatus, BorrowRecord, Notification, User, Role, NotificationType
-from app.services.notification import create_notification_in_db, dispatch_notification_task
+from app.models import Book, BookStatus, BorrowRecord, User, Role, NotificationType
+from app.services.notification import create_notifications_in_db, dispatch_notification_task
+from app.services.archive import archive_returned_loans_once
+from app.services.holds import expire_hold_claims_once
+from app.services.retention import prune_notifications_once
+from app.services.unread import reconcile_unread_counts_once
+from app.core.cache import invalidate, bump_versions
 
 CHECK_INTERVAL = 60 * 60
 REMINDER_DAYS_BEFORE = 1
 
 
+def _claim(criteria, values):
+    """UPDATE marking the open loans matching ``criteria`` as handled, then
+    a SELECT of what each needs for its notification.
+
+    Claiming in the UPDATE means two scans running at once never notify
+    the same loan twice.
+    """
+    claimed = (
+        update(BorrowRecord)
+        .where(BorrowRecord.returned_at.is_(None), *criteria)
+        .values(**values)
+        .returning(BorrowRecord.user_id, BorrowRecord.book_id, BorrowRecord.due_at)
+        .cte("claimed")
+    )
+    return (
+        select(claimed.c.user_id, claimed.c.book_id, claimed.c.due_at, Book.title, User.name)
+        .join(Book, Book.id == claimed.c.book_id)
+        .join(User, User.id == claimed.c.user_id)
+        .order_by(claimed.c.due_at)
+    )
+
+
 async def scan_due_and_overdue_once() -> None:
     async with get_session() as db:
         now = datetime.now(timezone.utc)
         reminder_window_end = now + timedelta(days=REMINDER_DAYS_BEFORE)
         
-        stmt = (
-            select(BorrowRecord)
-            .options(selectinload(BorrowRecord.book), selectinload(BorrowRecord.user))
-            .where(
-                BorrowRecord.returned_at.is_(None),
-                or_(
-                    (BorrowRecord.due_at < now) & (BorrowRecord.overdue_notified == False),
-                    (BorrowRecord.due_at <= reminder_window_end)
-                    & (BorrowRecord.due_at > now)
-                    & (BorrowRecord.reminder_sent_at.is_(None)),
-                ),
-            )
-        )
-
-        result = await db.execute(stmt)
-        records_to_process: List[BorrowRecord] = result.scalars().all()
-
-        if not records_to_process:
+        overdue = (await db.execute(_claim(
+            [BorrowRecord.due_at < now, BorrowRecord.overdue_notified == False],
+            {"overdue_notified": True},
+        ))).all()
+        due_soon = (await db.execute(_claim(
+            [BorrowRecord.due_at > now, BorrowRecord.due_at <= reminder_window_end,
+             BorrowRecord.reminder_sent_at.is_(None)],
+            {"reminder_sent_at": now},
+        ))).all()
+        
+        if not overdue and not due_soon:
+            await db.rollback()
             print("[scheduler] No records to process.")
             return
-
-        print(f"[scheduler] Processing {len(records_to_process)} records.")
         
-        tasks_to_dispatch = []
+        print(f"[scheduler] Processing {len(overdue)} overdue loans and {len(due_soon)} reminders.")
         
-        for borrow in records_to_process:
-            book = borrow.book
-            user = borrow.user
-            
-            if borrow.due_at < now and not borrow.overdue_notified:
-                print(f"[scheduler] Processing overdue book '{book.title}' for user '{user.name}'.")
-                book.status = BookStatus.Overdue
-                db.add(book)
-                
-                message = f"The book '{book.title}' was due on {borrow.due_at.date()}."
-                notif = await create_notification_in_db(db, user.id, message, NotificationType.Overdue)
-                
-                ws_payload = {
-                    "type": "notification",
-                    "data": {
-                        "id": notif.id, "message": notif.message,
-                        "is_read": notif.is_read, 
-                        "created_at": notif.created_at.isoformat()
-                        }
-                    }
-                tasks_to_dispatch.append(dispatch_notification_task(user.id, "Book Overdue", message, ws_payload))
-                
-                librarian_result = await db.execute(select(User).where(User.role == Role.Librarian))
-                for librarian in librarian_result.scalars().all():
-                    lib_message = f"User '{user.name}' has an overdue book: '{book.title}'."
-                    lib_notify = await create_notification_in_db(db, librarian.id, lib_message, NotificationType.System)
-                    lib_ws_payload = {
-                        "type": "notification", 
-                        "data": {
-                            "id": lib_notify.id, "message": lib_notify.message,
-                            "is_read": lib_notify.is_read, 
-                            "created_at": lib_notify.created_at.isoformat()
-                            }
-                        }
-                    tasks_to_dispatch.append(dispatch_notification_task(librarian.id, "System Alert; Overdue Book", lib_message, lib_ws_payload))
-                
-                borrow.overdue_notified = True
-                db.add(borrow)
-                
-            elif borrow.reminder_sent_at is None:
-                print(f"[scheduler] Sending reminder for '{book.title}' to user '{user.name}'.")
-                
-                message = f"The book '{book.title}' is due on {borrow.due_at.date()}."
-                notif = await create_notification_in_db(db, user.id, message, NotificationType.Reminder)
-                
-                ws_payload = {
-                    "type": "notification", 
-                    "data": {
-                        "id": notif.id, "message": notif.message,
-                        "is_read": notif.is_read,
-                        "created_at": notif.created_at.isoformat()
-                        }
-                    }
-                tasks_to_dispatch.append(dispatch_notification_task(user.id, "Book Due Soon", message, ws_payload))
-                
-                borrow.reminder_sent_at = now
-                db.add(borrow)
-                
+        overdue_books = {loan.book_id for loan in overdue}
+        if overdue_books:
+            await db.execute(
+                update(Book)
+                .where(Book.id == any_(literal(list(overdue_books), ARRAY(Integer))))
+                .values(status=BookStatus.Overdue)
+                .execution_options(synchronize_session=False)
+            )
+        
+        librarians = list(await db.scalars(select(User.id).where(User.role == Role.Librarian))) if overdue else []
+        
+        # (user id, message, type, dispatch subject) per notification
+        outgoing = []
+        for loan in overdue:
+            outgoing.append((loan.user_id, f"The book '{loan.title}' was due on {loan.due_at.date()}.",
+                             NotificationType.Overdue, "Book Overdue"))
+            lib_message = f"User '{loan.name}' has an overdue book: '{loan.title}'."
+            outgoing.extend(
+                (librarian_id, lib_message, NotificationType.System, "System Alert; Overdue Book")
+                for librarian_id in librarians
+            )
+        for loan in due_soon:
+            outgoing.append((loan.user_id, f"The book '{loan.title}' is due on {loan.due_at.date()}.",
+                             NotificationType.Reminder, "Book Due Soon"))
+        
+        created = await create_notifications_in_db(db, [(user_id, message, type) for user_id, message, type, _ in outgoing])
         await db.commit()
-        print(f"[scheduler] DB changes committed. Dispatching {len(tasks_to_dispatch)} notifications...")
+        
+        notified_users = {notif.user_id for notif in created}
+        await invalidate(*(f"book:{book_id}" for book_id in overdue_books))
+        await bump_versions(*(f"notifications:{user_id}" for user_id in notified_users))
+        print(f"[scheduler] DB changes committed. Dispatching {len(created)} notifications...")
+        
+        tasks_to_dispatch = []
+        for notif, (_, _, _, subject) in zip(created, outgoing):
+            ws_payload = {
+                "type": "notification",
+                "data": {
+                    "id": notif.id, "message": notif.message,
+                    "is_read": notif.is_read,
+                    "created_at": notif.created_at.isoformat()
+                    }
+                }
+            tasks_to_dispatch.append(dispatch_notification_task(notif.user_id, subject, notif.message, ws_payload))
         
         if tasks_to_dispatch:
             await asyncio.gather(*tasks_to_dispatch)
@@ -151,5 +152,25 @@ async def scheduler_loop(interval: int = CHECK_INTERVAL) -> None:
             import traceback
             traceback.print_exc()
         
+        try:
+            await expire_hold_claims_once()
+        except Exception as e:
+            print(f"[Scheduler Error] Expiring hold claims failed: {e}")
+        
+        try:
+            await archive_returned_loans_once()
+        except Exception as e:
+            print(f"[Scheduler Error] Archiving returned loans failed: {e}")
+        
+        try:
+            await prune_notifications_once()
+        except Exception as e:
+            print(f"[Scheduler Error] Pruning notifications failed: {e}")
+        
+        try:
+            await reconcile_unread_counts_once()
+        except Exception as e:
+            print(f"[Scheduler Error] Reconciling unread counts failed: {e}")
+        
         print(f"[scheduler] Next scan in {interval} seconds.")
         await asyncio.sleep(interval)
\ No newline at end of file
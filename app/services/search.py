@@ -0,0 +1,46 @@
+from sqlalchemy import Integer, any_, or_, select, func
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from app.models import Book, User
+
+
+def _escape_like(term: str) -> str:
+    return term.replace("!", "!!").replace("%", "!%").replace("_", "!_")
+
+
+def contains(column, term: str):
+    """Case-insensitive substring match.
+
+    Served by the ``gin_trgm_ops`` indexes declared on the model, so the
+    leading wildcard does not force a sequential scan.
+    """
+    return column.ilike(f"%{_escape_like(term)}%", escape="!")
+
+
+def rank(column, term: str):
+    """Relevance of ``column`` for ``term`` in [0, 1], higher is better."""
+    return func.word_similarity(term, column)
+
+
+def book_search_clause(term: str):
+    # The matching authors are collected once (an InitPlan over the users.name
+    # trigram index) into an array. Both branches of the OR are then plain
+    # index conditions and the planner can BitmapOr the books.title trigram
+    # index with the author_id index. An IN (subquery) here would be run as a
+    # filter SubPlan inside the OR, which forces a sequential scan of books.
+    matching_authors = func.array(
+        select(User.id).where(contains(User.name, term)).scalar_subquery(), type_=ARRAY(Integer)
+    )
+    return or_(contains(Book.title, term), Book.author_id == any_(matching_authors))
+
+
+def book_rank(term: str):
+    return rank(Book.title, term)
+
+
+def user_search_clause(term: str):
+    return or_(contains(User.name, term), contains(User.email, term))
+
+
+def user_rank(term: str):
+    return func.greatest(rank(User.name, term), rank(User.email, term))
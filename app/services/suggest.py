@@ -0,0 +1,234 @@
+import asyncio
+import heapq
+import json
+import unicodedata
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi_cache import FastAPICache
+from sqlalchemy import select
+
+from app.config import settings
+from app.database import get_session
+from app.models import Book, User, Role
+
+BOOK = "book"
+AUTHOR = "author"
+
+# Only the start of each term is indexed; nobody types 40 characters into a
+# type-ahead box, and the cap keeps the per-entry string size predictable.
+MAX_TERM_LENGTH = 40
+MAX_TERMS_PER_ITEM = 4
+SEP = "\x00"
+
+# A rebuild sorts in runs of this many entries, then merges them, so the
+# worker thread doing it hands the GIL back to the event loop in between.
+SORT_RUN = 50_000
+
+_CHANNEL = "suggest"
+
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(text.lower().split())
+
+
+def _terms(label: str) -> List[str]:
+    """Word-start suffixes of ``label``: "the great gatsby" is reachable from
+    "the g...", "great g..." and "gatsby"."""
+    words = normalize(label).split(" ")
+    terms = []
+    for i in range(min(len(words), MAX_TERMS_PER_ITEM)):
+        term = " ".join(words[i:])[:MAX_TERM_LENGTH]
+        if term and term not in terms:
+            terms.append(term)
+    return terms
+
+
+class SuggestIndex:
+    """In-memory prefix index over book titles and author names.
+
+    Entries live in one sorted list of ``"<term>\\0<kind>:<id>"`` strings, so a
+    lookup is a bisect plus a short forward scan. The total number of entries
+    is capped by ``settings.suggest_max_entries``: a rebuild loads books then
+    authors in id order until the cap, and items that do not fit are logged
+    and not suggested. Every worker holds its own copy; writes reach the
+    others through :func:`publish_suggestions`, and each published batch is
+    spliced into the list in a single pass.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: List[str] = []
+        self._labels: Dict[str, str] = {}
+        self._pending: Optional[List[Tuple[Dict[str, str], List[str]]]] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def update(self, add: Iterable[Tuple[str, int, str]] = (), remove: Iterable[Tuple[str, int]] = ()) -> None:
+        """Add or replace ``add`` (kind, id, label), then drop ``remove``
+        (kind, id), in one pass over the entries."""
+        added = {f"{kind}:{id}": label for kind, id, label in add}
+        removed = [f"{kind}:{id}" for kind, id in remove]
+        if self._pending is not None:
+            self._pending.append((added, removed))
+        self._update(added, removed)
+
+    def suggest(self, query: str, limit: int = 10) -> List[Tuple[str, int, str]]:
+        prefix = normalize(query)[:MAX_TERM_LENGTH]
+        if not prefix:
+            return []
+
+        results = []
+        seen = set()
+        entries = self._entries
+        i = bisect_left(entries, prefix)
+        while i < len(entries) and len(results) < limit:
+            entry = entries[i]
+            if not entry.startswith(prefix):
+                break
+            ref = entry.rsplit(SEP, 1)[1]
+            if ref not in seen:
+                seen.add(ref)
+                kind, id = ref.split(":")
+                results.append((kind, int(id), self._labels[ref]))
+            i += 1
+        return results
+
+    async def rebuild(self, db) -> None:
+        """Reload the index from the database without blocking readers.
+
+        Writes that happen while the rows stream in are recorded and replayed
+        on top of the fresh snapshot before it is swapped in.
+        """
+        self._pending = []
+        entries: List[str] = []
+        labels: Dict[str, str] = {}
+
+        sources = (
+            (BOOK, select(Book.id, Book.title)),
+            (AUTHOR, select(User.id, User.name).where(User.role == Role.Author)),
+        )
+        for kind, stmt in sources:
+            result = await db.stream(stmt.order_by(stmt.selected_columns[0]).execution_options(yield_per=5000))
+            async for id, label in result:
+                ref = f"{kind}:{id}"
+                terms = _terms(label)
+                if len(entries) + len(terms) > self.max_entries:
+                    await result.close()
+                    print(f"[suggest] Index full at {len(entries)} entries; {kind} items from id {id} on are not suggested.")
+                    break
+                labels[ref] = label
+                entries.extend(f"{term}{SEP}{ref}" for term in terms)
+
+        entries = await asyncio.get_running_loop().run_in_executor(None, _sorted, entries)
+        pending, self._pending = self._pending, None
+        self._entries, self._labels = entries, labels
+        for added, removed in pending:
+            self._update(added, removed)
+
+    def _update(self, added: Dict[str, str], removed: List[str]) -> None:
+        drop = []
+        for ref in (*added, *removed):
+            label = self._labels.pop(ref, None)
+            if label is not None:
+                drop.extend(f"{term}{SEP}{ref}" for term in _terms(label))
+
+        size = len(self._entries) - len(drop)
+        insert = []
+        gone = set(removed)
+        for ref, label in added.items():
+            if ref in gone:
+                continue
+            terms = _terms(label)
+            if size + len(terms) > self.max_entries:
+                print(f"[suggest] Index full at {size} entries; {ref} is not suggested.")
+                continue
+            self._labels[ref] = label
+            insert.extend(f"{term}{SEP}{ref}" for term in terms)
+            size += len(terms)
+
+        if drop or insert:
+            self._entries = _spliced(self._entries, sorted(drop), sorted(insert))
+
+
+def _spliced(entries: List[str], drop: List[str], insert: List[str]) -> List[str]:
+    """``entries`` without ``drop`` and with ``insert`` (both sorted).
+
+    The runs kept between changed positions are copied as slices, so a batch
+    of k changes costs k bisects plus one block copy of the list instead of k
+    element shifts of it.
+    """
+    out: List[str] = []
+    start = 0
+    for entry, inserting in heapq.merge(((e, False) for e in drop), ((e, True) for e in insert)):
+        i = bisect_left(entries, entry, start)
+        if inserting:
+            out += entries[start:i]
+            out.append(entry)
+            start = i
+        elif i < len(entries) and entries[i] == entry:
+            out += entries[start:i]
+            start = i + 1
+    out += entries[start:]
+    return out
+
+
+def _sorted(entries: List[str]) -> List[str]:
+    runs = [sorted(entries[i:i + SORT_RUN]) for i in range(0, len(entries), SORT_RUN)]
+    return list(heapq.merge(*runs))
+
+
+suggest_index = SuggestIndex(max_entries=settings.suggest_max_entries)
+
+
+def _redis():
+    return FastAPICache.get_backend().redis
+
+
+def _channel() -> str:
+    return f"{FastAPICache.get_prefix()}:{_CHANNEL}"
+
+
+async def publish_suggestions(
+    add: Iterable[Tuple[str, int, str]] = (), remove: Iterable[Tuple[str, int]] = ()
+) -> None:
+    """Apply ``add`` (kind, id, label) and ``remove`` (kind, id) to this
+    worker's index and broadcast them to the others."""
+    add, remove = list(add), list(remove)
+    suggest_index.update(add, remove)
+    try:
+        await _redis().publish(_channel(), json.dumps({"add": add, "remove": remove}))
+    except Exception as e:
+        print(f"[suggest] Publishing index changes failed: {e}")
+
+
+async def build_suggest_index() -> None:
+    async with get_session() as db:
+        await suggest_index.rebuild(db)
+    print(f"[suggest] Index built with {len(suggest_index)} entries.")
+
+
+async def listen_for_suggestions() -> None:
+    """Build the index, then keep it in step with writes on other workers.
+
+    Changes missed while disconnected cannot be replayed, so the index is
+    rebuilt whenever the subscription is (re)established. Messages arriving
+    during the rebuild wait in the subscription and are applied after it.
+    """
+    while True:
+        try:
+            pubsub = _redis().pubsub()
+            await pubsub.subscribe(_channel())
+            await build_suggest_index()
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    changes = json.loads(message["data"])
+                    suggest_index.update(changes["add"], changes["remove"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[suggest] Listener error: {e}")
+            await asyncio.sleep(1)
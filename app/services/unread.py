@@ -0,0 +1,183 @@
+import asyncio
+from collections import Counter
+from typing import Dict, Set
+
+from fastapi_cache import FastAPICache
+from sqlalchemy import Integer, any_, event, func, literal, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.database import get_session
+from app.models import Notification
+from app.realtime.manager import ws_manager
+
+# Per-user unread-notification counts in one Redis hash, so the inbox badge
+# never has to COUNT the notifications table.
+#
+# The table stays the source of truth. Code that creates or reads
+# notifications records the change on its session with note_unread(); once
+# that session commits, the counts move by exactly those amounts, and a
+# rollback drops them. Only counts already in the hash are moved: a missing
+# one is computed from the table on first read. Every change is published so
+# each worker pushes the new count to the user's open WebSockets.
+#
+# reconcile_unread_counts_once() corrects whatever drift is left (a crash
+# between commit and update, or a change racing a first read), and never
+# overwrites a count that moved while it was being checked.
+
+_COUNTS = "unread_counts"
+_CHANNEL = "unread"
+_PENDING = "unread_deltas"
+
+RECONCILE_BATCH_SIZE = 1000
+
+# KEYS[1] = counts, KEYS[2] = channel; ARGV = user id, delta, ...
+_ADJUST_LUA = """
+for i = 1, #ARGV, 2 do
+    if redis.call('HEXISTS', KEYS[1], ARGV[i]) == 1 then
+        local n = redis.call('HINCRBY', KEYS[1], ARGV[i], ARGV[i + 1])
+        if n < 0 then
+            n = 0
+            redis.call('HSET', KEYS[1], ARGV[i], 0)
+        end
+        redis.call('PUBLISH', KEYS[2], ARGV[i] .. ' ' .. n)
+    end
+end
+"""
+
+# KEYS[1] = counts, KEYS[2] = channel; ARGV = user id, expected, actual, ...
+# Returns how many counts were corrected.
+_RECONCILE_LUA = """
+local fixed = 0
+for i = 1, #ARGV, 3 do
+    if redis.call('HGET', KEYS[1], ARGV[i]) == ARGV[i + 1] then
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 2])
+        redis.call('PUBLISH', KEYS[2], ARGV[i] .. ' ' .. ARGV[i + 2])
+        fixed = fixed + 1
+    end
+end
+return fixed
+"""
+
+_background: Set["asyncio.Task"] = set()
+
+
+def _redis():
+    return FastAPICache.get_backend().redis
+
+
+def _key(name: str) -> str:
+    return f"{FastAPICache.get_prefix()}:{name}"
+
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def note_unread(db: AsyncSession, user_id: int, delta: int) -> None:
+    """Move ``user_id``'s unread count by ``delta`` once ``db`` commits."""
+    if delta:
+        db.info.setdefault(_PENDING, Counter())[user_id] += delta
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_after_commit(session: Session) -> None:
+    deltas = session.info.pop(_PENDING, None)
+    if deltas:
+        task = asyncio.get_running_loop().create_task(adjust_unread(deltas))
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_after_rollback(session: Session) -> None:
+    session.info.pop(_PENDING, None)
+
+
+async def adjust_unread(deltas: Dict[int, int]) -> None:
+    args = [value for user_id, delta in deltas.items() if delta for value in (user_id, delta)]
+    if not args:
+        return
+    try:
+        await _redis().eval(_ADJUST_LUA, 2, _key(_COUNTS), _key(_CHANNEL), *args)
+    except Exception as e:
+        print(f"[unread] Adjusting counts of {list(deltas)} failed: {e}")
+
+
+async def _count_from_table(db: AsyncSession, user_id: int) -> int:
+    return await db.scalar(
+        select(func.count()).where(Notification.user_id == user_id, Notification.is_read == False)
+    )
+
+
+async def unread_count(db: AsyncSession, user_id: int) -> int:
+    try:
+        cached = await _redis().hget(_key(_COUNTS), str(user_id))
+    except Exception as e:
+        print(f"[unread] Count read for user {user_id} failed: {e}")
+        return await _count_from_table(db, user_id)
+    if cached is not None:
+        return int(cached)
+
+    count = await _count_from_table(db, user_id)
+    try:
+        await _redis().hsetnx(_key(_COUNTS), str(user_id), count)
+    except Exception as e:
+        print(f"[unread] Count write for user {user_id} failed: {e}")
+    return count
+
+
+async def reconcile_unread_counts_once() -> None:
+    """Recount every cached unread count from the table, one batch of users
+    at a time."""
+    cursor, fixed, checked = 0, 0, 0
+    async with get_session() as db:
+        while True:
+            cursor, batch = await _redis().hscan(_key(_COUNTS), cursor, count=RECONCILE_BATCH_SIZE)
+            expected = {int(_text(user_id)): _text(count) for user_id, count in batch.items()}
+            if expected:
+                rows = await db.execute(
+                    select(Notification.user_id, func.count())
+                    .where(
+                        Notification.user_id == any_(literal(list(expected), ARRAY(Integer))),
+                        Notification.is_read == False,
+                    )
+                    .group_by(Notification.user_id)
+                )
+                actual = dict(rows.all())
+                await db.rollback()
+                args = [
+                    value
+                    for user_id, count in expected.items()
+                    if int(count) != actual.get(user_id, 0)
+                    for value in (user_id, count, actual.get(user_id, 0))
+                ]
+                if args:
+                    fixed += await _redis().eval(_RECONCILE_LUA, 2, _key(_COUNTS), _key(_CHANNEL), *args)
+                checked += len(expected)
+            if cursor == 0:
+                break
+    print(f"[unread] Reconciled {checked} counts, corrected {fixed}.")
+
+
+def unread_payload(count: int) -> Dict[str, object]:
+    return {"type": "unread", "data": {"unread": count}}
+
+
+async def listen_for_unread_counts() -> None:
+    """Push every published count change to the user's WebSockets on this worker."""
+    while True:
+        try:
+            pubsub = _redis().pubsub()
+            await pubsub.subscribe(_key(_CHANNEL))
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                user_id, count = _text(message["data"]).split(" ")
+                await ws_manager.send_to_user(int(user_id), unread_payload(int(count)))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[unread] Listener error: {e}")
+            await asyncio.sleep(1)
@@ -1,3 +1,5 @@
+from typing import Optional, Tuple
+
 from passlib.context import CryptContext
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -8,4 +10,10 @@ def hash_password(password: str) -> str:
 
 
 def verify_password(password: str, password_hash: str) -> bool:
-    return pwd_context.verify(password, password_hash)
\ No newline at end of file
+    return pwd_context.verify(password, password_hash)
+
+
+def verify_and_update_password(password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+    """Verify ``password`` and, when ``password_hash`` uses outdated
+    ``pwd_context`` settings, also return a fresh hash to store."""
+    return pwd_context.verify_and_update(password, password_hash)
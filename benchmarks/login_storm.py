@@ -0,0 +1,80 @@
+"""Event-loop latency while a burst of logins verifies bcrypt hashes.
+
+Runs the same storm twice: with ``verify_password`` called inline, as the
+login handler used to, and through ``app.core.hashing``'s process pool. A
+ticker coroutine measures how late the loop wakes it up; inline hashing shows
+up as lag of roughly one bcrypt call per tick.
+
+    python -m benchmarks.login_storm --logins 20
+
+Needs the same environment as the app (``.env``) because the pool reads its
+limits from ``app.config``; no database or Redis is used.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from fastapi import HTTPException
+
+from app.config import settings
+from app.core.hashing import verify_password_async, shutdown_hash_pool
+from app.utils import hash_password, verify_password
+
+TICK = 0.01
+
+_rejected: list = []
+
+
+async def _ticker(stop: asyncio.Event, lags: list) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - start - TICK)
+
+
+async def _inline(password: str, password_hash: str) -> None:
+    verify_password(password, password_hash)
+    await asyncio.sleep(0)
+
+
+async def _pooled(password: str, password_hash: str) -> None:
+    try:
+        await verify_password_async(password, password_hash)
+    except HTTPException:
+        # Shed by the queue limit or timeout; a client would get a 503.
+        _rejected.append(1)
+
+
+async def storm(name: str, login, logins: int, password_hash: str) -> None:
+    stop, lags = asyncio.Event(), []
+    ticker = asyncio.create_task(_ticker(stop, lags))
+    await asyncio.sleep(TICK * 5)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(login("correct horse", password_hash) for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await ticker
+    lags_ms = sorted(lag * 1000 for lag in lags)
+    p99 = lags_ms[min(len(lags_ms) - 1, int(len(lags_ms) * 0.99))]
+    print(f"{name:<8} {logins} logins in {elapsed:6.2f}s | loop lag ms: "
+          f"median {statistics.median(lags_ms):7.2f}  p99 {p99:7.2f}  max {lags_ms[-1]:7.2f}"
+          f" | rejected {len(_rejected)}")
+
+
+async def main(logins: int) -> None:
+    password_hash = hash_password("correct horse")
+    # Warm the pool so worker start-up is not counted against it.
+    await verify_password_async("correct horse", password_hash)
+
+    await storm("inline", _inline, logins, password_hash)
+    await storm("pooled", _pooled, logins, password_hash)
+    shutdown_hash_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=min(20, settings.password_hash_queue))
+    asyncio.run(main(parser.parse_args().logins))